@@ -0,0 +1,285 @@
+"""Shared upload handling for the API endpoints."""
+from fastapi import Depends, File, UploadFile, HTTPException
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, FrozenSet, Iterator, NamedTuple, Optional, Sequence
+import asyncio
+import tempfile
+import os
+import logging
+import numpy as np
+import cv2
+import io
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Optional libjpeg-turbo binding: decodes JPEG straight to RGB
+TURBOJPEG_AVAILABLE = False
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbo_jpeg = TurboJPEG()
+    TURBOJPEG_AVAILABLE = True
+except (ImportError, OSError, RuntimeError):
+    logger.debug("PyTurboJPEG not available; using OpenCV for JPEG decode")
+
+_JPEG_MAGIC = b"\xff\xd8\xff"
+_EXIF_HEADER = b"Exif\x00\x00"
+_EXIF_ORIENTATION_TAG = 0x0112
+
+# Read uploads in 64KB chunks so oversized files are rejected early
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Chunk size when streaming a spooled upload straight to disk
+SPOOL_COPY_CHUNK_SIZE = 1024 * 1024
+
+# OpenCV >= 4.10 can decode straight to RGB, skipping a full cvtColor pass
+_IMREAD_COLOR_RGB = getattr(cv2, "IMREAD_COLOR_RGB", None)
+
+
+async def read_bounded(file: UploadFile, limit: int = settings.MAX_FILE_SIZE) -> bytes:
+    """
+    Read an upload chunk by chunk, failing as soon as it exceeds `limit`.
+
+    Avoids buffering an arbitrarily large body before the size check.
+    """
+    buffer = io.BytesIO()
+    total = 0
+
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > limit:
+            raise _too_large(limit)
+        buffer.write(chunk)
+
+    return buffer.getvalue()
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(413, f"File too large. Max: {limit // (1024*1024)}MB")
+
+
+class Upload(NamedTuple):
+    """A validated, fully read upload."""
+    file: UploadFile
+    contents: bytes
+    ext: str
+
+
+class UploadRef(NamedTuple):
+    """A validated upload whose body has not been read into memory."""
+    file: UploadFile
+    ext: str
+
+
+class ImageUpload(NamedTuple):
+    """A validated image upload with its decoded RGB array."""
+    file: UploadFile
+    contents: bytes
+    ext: str
+    image: np.ndarray
+
+
+def upload_extension(filename: Optional[str]) -> str:
+    """Lower-cased extension (with dot) of an upload filename, or ''."""
+    if not filename or '.' not in filename:
+        return ''
+    return '.' + filename.rsplit('.', 1)[-1].lower()
+
+
+def validate_upload(
+    file: UploadFile,
+    allowed: Sequence[str],
+    allowed_set: Optional[FrozenSet[str]] = None
+) -> str:
+    """
+    Check the upload has a supported extension. Returns the extension.
+    
+    `allowed_set` is an optional precomputed frozenset of `allowed` for the
+    membership test; `allowed` itself is only used for the error message.
+    """
+    if not file.filename:
+        raise HTTPException(400, "No filename provided")
+    
+    ext = upload_extension(file.filename)
+    if ext not in (allowed_set if allowed_set is not None else allowed):
+        raise HTTPException(
+            400, 
+            f"Unsupported format. Supported: {list(allowed)}"
+        )
+    return ext
+
+
+def upload_dependency(allowed: Sequence[str]):
+    """
+    Build a FastAPI dependency for the `file` form field.
+    
+    The dependency validates the extension against `allowed` and reads the
+    body with the bounded reader, yielding an Upload.
+    """
+    allowed_set = frozenset(allowed)
+    
+    async def dependency(file: UploadFile = File(...)) -> Upload:
+        ext = validate_upload(file, allowed, allowed_set)
+        contents = await read_bounded(file)
+        return Upload(file, contents, ext)
+    
+    return dependency
+
+
+def upload_ref_dependency(allowed: Sequence[str]):
+    """
+    Like upload_dependency, but only validates; the body is left in the
+    UploadFile's spooled temp file for spooled_upload_path to stream.
+    """
+    allowed_set = frozenset(allowed)
+    
+    async def dependency(file: UploadFile = File(...)) -> UploadRef:
+        return UploadRef(file, validate_upload(file, allowed, allowed_set))
+    
+    return dependency
+
+
+image_upload = upload_dependency(settings.SUPPORTED_IMAGE_FORMATS)
+audio_upload = upload_dependency(settings.SUPPORTED_AUDIO_FORMATS)
+# Videos are streamed to disk by spooled_upload_path, never held in memory
+video_upload = upload_ref_dependency(settings.SUPPORTED_VIDEO_FORMATS)
+
+
+async def validated_image(upload: Upload = Depends(image_upload)) -> ImageUpload:
+    """Dependency: validated image upload, decoded once to RGB."""
+    image = decode_image_rgb(upload.contents)
+    if image is None:
+        raise HTTPException(400, "Could not decode image")
+    return ImageUpload(*upload, image)
+
+
+def _jpeg_orientation(contents: bytes) -> int:
+    """
+    EXIF Orientation (1-8) of a JPEG, or 1 when it has none.
+    
+    Only the marker segments before the scan data are walked, so this
+    reads a few hundred bytes at most.
+    """
+    i = 2
+    end = len(contents)
+    while i + 4 <= end and contents[i] == 0xFF:
+        marker = contents[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker in (0xD9, 0xDA):  # End of image / start of scan
+            break
+        length = int.from_bytes(contents[i + 2:i + 4], "big")
+        if marker == 0xE1 and contents[i + 4:i + 10] == _EXIF_HEADER:
+            tiff = i + 10
+            order = "little" if contents[tiff:tiff + 2] == b"II" else "big"
+            ifd = tiff + int.from_bytes(contents[tiff + 4:tiff + 8], order)
+            count = int.from_bytes(contents[ifd:ifd + 2], order)
+            for entry in range(ifd + 2, min(ifd + 2 + 12 * count, end - 11), 12):
+                if int.from_bytes(contents[entry:entry + 2], order) == _EXIF_ORIENTATION_TAG:
+                    return int.from_bytes(contents[entry + 8:entry + 10], order) or 1
+            return 1
+        i += 2 + length
+    return 1
+
+
+def _turbojpeg_applies(contents: bytes) -> bool:
+    """
+    Whether TurboJPEG can decode these bytes as OpenCV would.
+    
+    TurboJPEG ignores EXIF orientation, which cv2.imdecode applies, so
+    rotated or mirrored JPEGs (typical of phone photos) go through OpenCV.
+    """
+    return (
+        TURBOJPEG_AVAILABLE
+        and contents[:3] == _JPEG_MAGIC
+        and _jpeg_orientation(contents) == 1
+    )
+
+
+def decode_image_rgb(contents: bytes) -> Optional[np.ndarray]:
+    """Decode encoded image bytes to an RGB array, or None if undecodable."""
+    # JPEG is the dominant upload format; TurboJPEG does it in one RGB pass
+    if _turbojpeg_applies(contents):
+        try:
+            return _turbo_jpeg.decode(contents, pixel_format=TJPF_RGB)
+        except Exception as e:
+            logger.debug(f"TurboJPEG decode failed, falling back to OpenCV: {e}")
+    
+    nparr = np.frombuffer(contents, np.uint8)
+
+    if _IMREAD_COLOR_RGB is not None:
+        return cv2.imdecode(nparr, _IMREAD_COLOR_RGB)
+
+    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def decode_image_bgr(contents: bytes) -> Optional[np.ndarray]:
+    """Decode encoded image bytes to a BGR array, or None if undecodable."""
+    if _turbojpeg_applies(contents):
+        try:
+            return _turbo_jpeg.decode(contents)  # BGR is TurboJPEG's default
+        except Exception as e:
+            logger.debug(f"TurboJPEG decode failed, falling back to OpenCV: {e}")
+    
+    return cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+
+
+@contextmanager
+def upload_tempfile(contents: bytes, ext: str) -> Iterator[str]:
+    """
+    Write upload bytes into a per-request temp directory and yield the path.
+    
+    The whole directory is removed on exit, on success or error, including
+    any sidecar files a handler writes next to the upload.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "upload" + ext)
+        Path(path).write_bytes(contents)
+        yield path
+
+
+def _copy_bounded(src: BinaryIO, dst_path: str, limit: int, hasher=None) -> None:
+    """Copy `src` to `dst_path` in chunks, optionally hashing, up to `limit` bytes."""
+    src.seek(0)
+    total = 0
+    with open(dst_path, 'wb') as dst:
+        while True:
+            chunk = src.read(SPOOL_COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > limit:
+                raise _too_large(limit)
+            if hasher is not None:
+                hasher.update(chunk)
+            dst.write(chunk)
+
+
+@asynccontextmanager
+async def spooled_upload_path(
+    file: UploadFile,
+    ext: str,
+    hasher=None,
+    limit: int = settings.MAX_FILE_SIZE
+) -> AsyncIterator[str]:
+    """
+    Stream an upload into a per-request temp directory and yield the path.
+    
+    Copies from the UploadFile's underlying SpooledTemporaryFile in a worker
+    thread, so memory stays at one chunk however large the upload is. Pass
+    a hashlib-style `hasher` to digest the content in the same pass. The
+    directory is removed on exit, as with upload_tempfile.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "upload" + ext)
+        await asyncio.to_thread(_copy_bounded, file.file, path, limit, hasher)
+        yield path
@@ -1,25 +1,374 @@
 """Advanced Analytics API endpoint using HuggingFace and NVIDIA Hive models."""
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from datetime import datetime
 from typing import Optional
+from contextlib import contextmanager
+import asyncio
 import uuid
 import time
 import tempfile
-import os
 import logging
 
+import cv2
+import numpy as np
+
 from app.services.advanced_analytics import advanced_analytics
 from app.services.nvidia_hive import nvidia_hive
+from app.services.fusion_engine import fusion_engine
+from app.services.result_cache import result_cache
+from app.services.vera_ai import vera_ai
 from app.config import settings
+from app.api._uploads import (
+    ImageUpload, Upload, UploadRef, audio_upload, decode_image_rgb,
+    spooled_upload_path, upload_dependency, upload_tempfile, validated_image,
+    video_upload
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Local models are optional for the enhanced endpoints; resolve them once
+# at import time instead of inside every request
+try:
+    from app.services.visual_detector import visual_detector
+    from app.services.forensic_analyzer import forensic_analyzer
+    from app.services.temporal_detector import temporal_detector
+    from app.services.audio_detector import audio_detector
+    _LOCAL_AVAILABLE = True
+except ImportError as e:
+    logger.error(f"Could not import local services for ensemble: {e}")
+    _LOCAL_AVAILABLE = False
+
+# Ensemble weights per signal (renormalized over the branches that answered)
+IMAGE_ENSEMBLE_WEIGHTS = {"nvidia_hive": 0.30, "huggingface": 0.35, "local_ensemble": 0.35}
+VIDEO_ENSEMBLE_WEIGHTS = {"nvidia_hive": 0.30, "huggingface": 0.35, "local_temporal": 0.35}
+
+# NVIDIA Hive only takes JPEG/PNG
+_nvidia_image_upload = upload_dependency(['.jpg', '.jpeg', '.png'])
+
+
+async def _gather_signals(branches: list) -> tuple:
+    """
+    Run ensemble branches concurrently and fold their results.
+    
+    Args:
+        branches: List of (signal_key, label, coroutine) tuples
+        
+    Returns:
+        (ensemble_scores, signals) in branch order. Branches that raise or
+        return None are logged and skipped.
+    """
+    results = await asyncio.gather(
+        *(coro for _, _, coro in branches),
+        return_exceptions=True
+    )
+    
+    ensemble_scores = []
+    signals = {}
+    for (key, label, _), result in zip(branches, results):
+        if isinstance(result, Exception):
+            logger.error(f"{label} failed in ensemble: {result}")
+            continue
+        if result is None:
+            continue
+        ensemble_scores.append(result['risk_score'])
+        signals[key] = result
+    
+    return ensemble_scores, signals
+
+
+@contextmanager
+def _upload_source(contents: bytes, ext: str, in_memory: bool):
+    """
+    Expose upload bytes to a file-reading service.
+    
+    Yields a SpooledTemporaryFile (kept in RAM below UPLOAD_SPOOL_SIZE) when
+    the consumer accepts file objects, otherwise a temp file path that is
+    removed on exit.
+    """
+    if in_memory:
+        with tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_SIZE) as buf:
+            buf.write(contents)
+            buf.seek(0)
+            yield buf
+        return
+    
+    with upload_tempfile(contents, ext) as tmp_path:
+        yield tmp_path
+
+
+async def _nvidia_image_signal(contents: bytes, content_type: Optional[str]) -> Optional[dict]:
+    """NVIDIA Hive branch of the image ensemble."""
+    res_nv = await asyncio.to_thread(nvidia_hive.analyze_image, contents, content_type)
+    if 'error' in res_nv:
+        return None
+    return {
+        'risk_score': res_nv.get('risk_score', 50),
+        'classification': res_nv.get('classification'),
+        'confidence': res_nv.get('confidence')
+    }
+
+
+async def _huggingface_image_signal(contents: bytes) -> Optional[dict]:
+    """HuggingFace branch of the image ensemble."""
+    res_hf = await asyncio.to_thread(advanced_analytics.analyze_image, contents)
+    if 'error' in res_hf:
+        return None
+    return {
+        'risk_score': res_hf.get('risk_score', 50),
+        'classification': res_hf.get('classification'),
+        'confidence': res_hf.get('confidence')
+    }
+
+
+def _decode_image(contents: bytes):
+    """
+    Decode upload bytes once into an RGB array shared by all local models.
+    
+    Ensemble branches run as threads in this process, so they all read this
+    one array by reference; no per-branch copy or shared-memory segment is
+    needed. Analyzers must treat it as read-only.
+    """
+    
+    image = decode_image_rgb(contents)
+    if image is None:
+        raise HTTPException(400, "Could not decode image")
+    return image
+
+
+async def _local_image_signal(image) -> dict:
+    """Local models branch of the image ensemble."""
+    
+    # Visual and forensic models are independent and both spend their time
+    # in native code (torch / OpenCV / onnxruntime), so overlap them too.
+    vis_res, for_res = await asyncio.gather(
+        asyncio.to_thread(visual_detector.analyze, image),
+        asyncio.to_thread(forensic_analyzer.analyze, image)
+    )
+    local_fused = fusion_engine.fuse_image_signals(vis_res, for_res)
+    
+    return {
+        'risk_score': local_fused.get('risk_score', 50),
+        'classification': local_fused.get('classification'),
+        'confidence': local_fused.get('confidence'),
+        'forensic_plots': for_res.get('plots', {}),
+        'forensic_details': for_res.get('details', {})
+    }
+
+
+async def _nvidia_video_signal(video_path: str, max_frames: int) -> Optional[dict]:
+    """NVIDIA Hive branch of the video ensemble."""
+    res_nv = await asyncio.to_thread(nvidia_hive.analyze_video, video_path, num_frames=max_frames)
+    if 'error' in res_nv:
+        return None
+    return {
+        'risk_score': res_nv.get('risk_score', 50),
+        'classification': res_nv.get('classification')
+    }
+
+
+def _run_huggingface_video(video_path: str) -> Optional[dict]:
+    """Sample 3 frames and score each with the HuggingFace ensemble."""
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    targets = set(np.linspace(0, max(total - 1, 0), 3, dtype=np.int64).tolist())
+    
+    # Step through the stream once instead of seeking per frame; grab() skips
+    # the colour conversion for frames we do not keep.
+    encoded_frames = []
+    last_target = max(targets)
+    for frame_idx in range(last_target + 1):
+        if not cap.grab():
+            break
+        if frame_idx not in targets:
+            continue
+        ret, frame = cap.retrieve()
+        if not ret:
+            continue
+        
+        # Encode in memory; HF accepts raw image bytes
+        ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not ok:
+            continue
+        
+        encoded_frames.append(buf.tobytes())
+    cap.release()
+    
+    # Score all sampled frames in one concurrent batch
+    results = advanced_analytics.analyze_images_batch(encoded_frames)
+    hf_scores = np.fromiter(
+        (res['risk_score'] for res in results if 'risk_score' in res),
+        dtype=np.float64
+    )
+    
+    if hf_scores.size == 0:
+        return None
+    
+    return {'risk_score': float(hf_scores.mean()), 'frames_sampled': int(hf_scores.size)}
+
+
+async def _huggingface_video_signal(video_path: str) -> Optional[dict]:
+    """HuggingFace branch of the video ensemble (sampled frames)."""
+    return await asyncio.to_thread(_run_huggingface_video, video_path)
+
+
+async def _temporal_video_signal(video_path: str) -> Optional[dict]:
+    """Local 3D CNN branch of the video ensemble."""
+    res_temp = await asyncio.to_thread(temporal_detector.analyze, video_path)
+    if 'error' in res_temp:
+        return None
+    return {
+        'risk_score': res_temp.get('risk_score', 50),
+        'classification': res_temp.get('classification')
+    }
+
+
+def _is_decisive(signal: dict, remote_keys: list) -> bool:
+    """
+    True when the local signal fixes the ensemble label on its own.
+    
+    The fused score is the weighted mean of the local score and the remote
+    ones, so it is bounded by the remotes all scoring 0 or all scoring 100;
+    the local result is decisive only when both bounds classify the same.
+    Fewer answering remotes only narrow that range. With the local branch
+    at 35% of IMAGE_ENSEMBLE_WEIGHTS this cannot hold while both remotes
+    are scheduled.
+    """
+    if signal.get('confidence') != "HIGH":
+        return False
+    
+    local_weight = IMAGE_ENSEMBLE_WEIGHTS["local_ensemble"]
+    remote_weight = sum(IMAGE_ENSEMBLE_WEIGHTS[k] for k in remote_keys)
+    total = local_weight + remote_weight
+    weighted_local = local_weight * signal['risk_score']
+    lowest = weighted_local / total
+    highest = (weighted_local + remote_weight * 100.0) / total
+    return fusion_engine.classify(lowest) == fusion_engine.classify(highest)
+
+
+async def _image_ensemble(contents: bytes, image, content_type: str) -> tuple:
+    """
+    Run the NVIDIA + HuggingFace + Local image ensemble.
+    
+    All branches start concurrently. When early exit is enabled the local
+    result is awaited first: if it is HIGH confidence and holds its label
+    whatever the remote branches score (see _is_decisive), the response
+    returns without waiting for the NVIDIA/HF calls and mode is
+    "early_exit_local". Undecided cases keep the fully parallel latency.
+    The remote requests already sent still complete in their threads, so
+    the early exit saves latency, not API quota.
+    
+    Returns:
+        (result, complete) where result holds mode, classification,
+        confidence, risk_score, prediction and signals, and complete is True
+        when every scheduled branch produced a signal (never for an early
+        exit, so those results are not cached as a full ensemble).
+    """
+    # The branches are independent, so run them concurrently: the remote
+    # calls are network-bound and the local models are CPU-bound.
+    branches = []
+    if nvidia_hive.is_available():
+        branches.append(("nvidia_hive", "NVIDIA Hive", _nvidia_image_signal(contents, content_type)))
+    if advanced_analytics.is_available():
+        branches.append(("huggingface", "HF", _huggingface_image_signal(contents)))
+    
+    if _LOCAL_AVAILABLE and settings.ENSEMBLE_EARLY_EXIT:
+        # Start the remote calls now; they run while local fusion does
+        branches = [(key, label, asyncio.create_task(coro)) for key, label, coro in branches]
+        local_scores, local_signals = await _gather_signals(
+            [("local_ensemble", "Local analysis", _local_image_signal(image))]
+        )
+        local = local_signals.get("local_ensemble")
+        if local is not None and _is_decisive(local, [key for key, _, _ in branches]):
+            # Requests already sent still finish in their worker threads,
+            # but nothing waits for them
+            for _, _, task in branches:
+                task.cancel()
+            result = {
+                "mode": "early_exit_local",
+                "classification": fusion_engine.classify(local['risk_score']),
+                "confidence": "HIGH",
+                "risk_score": round(local['risk_score'], 2),
+                "prediction": {
+                    "fake_probability": local['risk_score'] / 100,
+                    "real_probability": 1 - (local['risk_score'] / 100)
+                },
+                "signals": local_signals
+            }
+            return result, False
+        local_done = True
+    else:
+        local_scores, local_signals = [], {}
+        local_done = False
+    
+    if _LOCAL_AVAILABLE and not local_done:
+        branches.append(("local_ensemble", "Local analysis", _local_image_signal(image)))
+    
+    remote_scores, remote_signals = await _gather_signals(branches)
+    ensemble_scores = remote_scores + local_scores
+    signals = {**remote_signals, **local_signals}
+    
+    if not ensemble_scores:
+        raise HTTPException(500, "All analysis methods failed")
+
+    # Weighted Ensemble: NVIDIA=30%, HuggingFace=35%, Local=35%
+    avg_risk, classification = fusion_engine.weighted_ensemble(signals, IMAGE_ENSEMBLE_WEIGHTS)
+    
+    result = {
+        "mode": "enhanced_ensemble",
+        "classification": classification,
+        "confidence": "HIGH" if len(ensemble_scores) >= 2 else "MEDIUM",
+        "risk_score": round(avg_risk, 2),
+        "prediction": {
+            "fake_probability": avg_risk / 100,
+            "real_probability": 1 - (avg_risk / 100)
+        },
+        "signals": signals
+    }
+    scheduled = len(branches) + (1 if local_done else 0)
+    return result, len(signals) == scheduled
+
+
+async def _video_ensemble(video_path: str, max_frames: int) -> tuple:
+    """
+    Run the NVIDIA + HuggingFace + Local Temporal video ensemble.
+    
+    Returns:
+        (result, complete), as for _image_ensemble.
+    """
+    # Branches run concurrently
+    branches = []
+    if nvidia_hive.is_available():
+        branches.append(("nvidia_hive", "NVIDIA Video", _nvidia_video_signal(video_path, max_frames)))
+    if advanced_analytics.is_available():
+        branches.append(("huggingface", "HF Video", _huggingface_video_signal(video_path)))
+    if _LOCAL_AVAILABLE:
+        branches.append(("local_temporal", "Local Temporal", _temporal_video_signal(video_path)))
+    
+    ensemble_scores, signals = await _gather_signals(branches)
+    
+    if not ensemble_scores:
+        raise HTTPException(500, "All video analysis methods failed")
+    
+    # Weighted Ensemble: NVIDIA=30%, HuggingFace=35%, Local Temporal=35%
+    avg_risk, classification = fusion_engine.weighted_ensemble(signals, VIDEO_ENSEMBLE_WEIGHTS)
+    
+    result = {
+        "classification": classification,
+        "confidence": "HIGH",
+        "risk_score": round(avg_risk, 2),
+        "prediction": {
+            "fake_probability": avg_risk / 100,
+            "real_probability": 1 - (avg_risk / 100)
+        },
+        "signals": signals
+    }
+    return result, len(signals) == len(branches)
+
 
 @router.get("/status")
 async def get_advanced_status():
     """Check if Enhanced Detection services are available."""
-    from app.services.vera_ai import vera_ai
     return {
         "huggingface_available": advanced_analytics.is_available(),
         "nvidia_hive_available": nvidia_hive.is_available(),
@@ -31,7 +380,7 @@ async def get_advanced_status():
 
 
 @router.post("/image/")
-async def analyze_image_advanced(file: UploadFile = File(...)):
+async def analyze_image_advanced(upload: Upload = Depends(_nvidia_image_upload)):
     """
     Analyze image using Enhanced AI Detection (NVIDIA Hive).
     
@@ -47,127 +396,23 @@ async def analyze_image_advanced(file: UploadFile = File(...)):
             "Enhanced AI not available. NVIDIA_API_KEY not set."
         )
     
-    # Validate file
-    if not file.filename:
-        raise HTTPException(400, "No filename provided")
-    
-    ext = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
-    if ext not in ['.jpg', '.jpeg', '.png']:
-        raise HTTPException(400, f"Unsupported format. Use JPG or PNG.")
-    
-    # Read and save temp file
-    contents = await file.read()
-    if len(contents) > settings.MAX_FILE_SIZE:
-        raise HTTPException(413, "File too large")
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(contents)
-        tmp_path = tmp.name
+    # Validated and read by the dependency; the remote APIs take the raw
+    # bytes directly, so nothing is written to disk
+    file, contents, ext = upload
     
-    # Grand Ensemble: NVIDIA + HuggingFace + Local
+    cache_key = result_cache.make_key("advanced_image", contents)
+    result = result_cache.get(cache_key)
+    cached = result is not None
     
-    # Imports for local models
-    try:
-        import cv2
-        import numpy as np
-        from app.services.visual_detector import visual_detector
-        from app.services.forensic_analyzer import forensic_analyzer
-        from app.services.fusion_engine import fusion_engine
-    except ImportError:
-        logger.error("Could not import local services for ensemble")
-    
-    ensemble_scores = []
-    signals = {}
-    
-    # 1. NVIDIA Hive
-    if nvidia_hive.is_available():
-        try:
-            res_nv = nvidia_hive.analyze_image(tmp_path)
-            if 'error' not in res_nv:
-                score = res_nv.get('risk_score', 50)
-                ensemble_scores.append(score)
-                signals['nvidia_hive'] = {
-                    'risk_score': score, 
-                    'classification': res_nv.get('classification'),
-                    'confidence': res_nv.get('confidence')
-                }
-        except Exception as e:
-            logger.error(f"NVIDIA Hive failed in ensemble: {e}")
-
-    # 2. HuggingFace
-    if advanced_analytics.is_available():
-        try:
-            res_hf = advanced_analytics.analyze_image(tmp_path)
-            if 'error' not in res_hf:
-                score = res_hf.get('risk_score', 50)
-                ensemble_scores.append(score)
-                signals['huggingface'] = {
-                    'risk_score': score,
-                    'classification': res_hf.get('classification'),
-                    'confidence': res_hf.get('confidence')
-                }
-        except Exception as e:
-            logger.error(f"HF failed in ensemble: {e}")
-            
-    # 3. Local Models
-    try:
-        # Load image
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        vis_res = visual_detector.analyze(image)
-        for_res = forensic_analyzer.analyze(image)
-        local_fused = fusion_engine.fuse_image_signals(vis_res, for_res)
-        
-        score = local_fused.get('risk_score', 50)
-        ensemble_scores.append(score)
-        signals['local_ensemble'] = {
-            'risk_score': score,
-            'classification': local_fused.get('classification'),
-            'confidence': local_fused.get('confidence'),
-            'forensic_plots': for_res.get('plots', {}),
-            'forensic_details': for_res.get('details', {})
-        }
-    except Exception as e:
-        logger.error(f"Local analysis failed in ensemble: {e}")
-
-    if not ensemble_scores:
-        raise HTTPException(500, "All analysis methods failed")
-
-    # Weighted Ensemble: NVIDIA=30%, HuggingFace=35%, Local=35%
-    weighted_sum = 0.0
-    total_weight = 0.0
-    
-    if 'nvidia_hive' in signals:
-        nvidia_score = signals['nvidia_hive']['risk_score']
-        weighted_sum += nvidia_score * 0.30  # 30% weight for NVIDIA
-        total_weight += 0.30
-    
-    if 'huggingface' in signals:
-        hf_score = signals['huggingface']['risk_score']
-        weighted_sum += hf_score * 0.35  # 35% weight for HuggingFace
-        total_weight += 0.35
-    
-    if 'local_ensemble' in signals:
-        local_score = signals['local_ensemble']['risk_score']
-        weighted_sum += local_score * 0.35  # 35% weight for Local
-        total_weight += 0.35
-    
-    # Calculate weighted average
-    if total_weight > 0:
-        avg_risk = weighted_sum / total_weight
-    else:
-        avg_risk = sum(ensemble_scores) / len(ensemble_scores)
+    if not cached:
+        image = _decode_image(contents)
+        content_type = "image/png" if ext == ".png" else "image/jpeg"
+        result, complete = await _image_ensemble(contents, image, content_type)
+        # Only cache when every branch answered; a transient remote failure
+        # should not be replayed for the rest of the TTL
+        if complete:
+            result_cache.set(cache_key, result)
     
-    # Classification
-    if avg_risk >= 70:
-        classification = "MANIPULATED"
-    elif avg_risk >= 40:
-        classification = "SUSPICIOUS"
-    else:
-        classification = "AUTHENTIC"
-        
     processing_time = int((time.time() - start_time) * 1000)
     
     return {
@@ -175,26 +420,15 @@ async def analyze_image_advanced(file: UploadFile = File(...)):
         "timestamp": datetime.utcnow().isoformat(),
         "media_type": "image",
         "filename": file.filename,
-        "mode": "enhanced_ensemble",
         "model": "Ensemble (NVIDIA 30% + HF 35% + Local 35%)",
-        "classification": classification,
-        "confidence": "HIGH" if len(ensemble_scores) >= 2 else "MEDIUM",
-        "risk_score": round(avg_risk, 2),
-        "prediction": {
-            "fake_probability": avg_risk / 100,
-            "real_probability": 1 - (avg_risk / 100)
-        },
-        "signals": signals,
+        **result,
+        "cached": cached,
         "processing_time_ms": processing_time
     }
-    
-    # Cleanup temp file
-    if os.path.exists(tmp_path):
-        os.unlink(tmp_path)
 
 
 @router.post("/compare/")
-async def compare_analysis(file: UploadFile = File(...)):
+async def compare_analysis(upload: ImageUpload = Depends(validated_image)):
     """
     Run both Basic and Advanced analytics and compare results.
     
@@ -202,74 +436,48 @@ async def compare_analysis(file: UploadFile = File(...)):
     """
     start_time = time.time()
     
-    # Validate
-    if not file.filename:
-        raise HTTPException(400, "No filename provided")
+    if not _LOCAL_AVAILABLE:
+        raise HTTPException(503, "Local models not available")
     
-    ext = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
-    if ext not in settings.SUPPORTED_IMAGE_FORMATS:
-        raise HTTPException(400, f"Unsupported format: {ext}")
+    file, contents, _, image = upload
     
-    contents = await file.read()
+    # Basic analysis
+    visual_result = visual_detector.analyze(image)
+    forensic_result = forensic_analyzer.analyze(image, generate_plots=False)
+    basic_fused = fusion_engine.fuse_image_signals(visual_result, forensic_result)
     
-    # Save temp file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(contents)
-        tmp_path = tmp.name
+    # Advanced analysis (if available)
+    advanced_result = None
+    if advanced_analytics.is_available():
+        advanced_result = advanced_analytics.analyze_image(contents)
     
-    try:
-        import numpy as np
-        import cv2
-        from app.services.visual_detector import visual_detector
-        from app.services.forensic_analyzer import forensic_analyzer
-        from app.services.fusion_engine import fusion_engine
-        
-        # Load image for basic analysis
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Basic analysis
-        visual_result = visual_detector.analyze(image)
-        forensic_result = forensic_analyzer.analyze(image)
-        basic_fused = fusion_engine.fuse_image_signals(visual_result, forensic_result)
-        
-        # Advanced analysis (if available)
-        advanced_result = None
-        if advanced_analytics.is_available():
-            advanced_result = advanced_analytics.analyze_image(tmp_path)
-        
-        processing_time = int((time.time() - start_time) * 1000)
-        
-        return {
-            "analysis_id": str(uuid.uuid4()),
-            "timestamp": datetime.utcnow().isoformat(),
-            "filename": file.filename,
-            "comparison": {
-                "basic": {
-                    "classification": basic_fused['classification'],
-                    "risk_score": basic_fused['risk_score'],
-                    "confidence": basic_fused['confidence'],
-                    "signals": basic_fused.get('signal_values', {})
-                },
-                "advanced": {
-                    "available": advanced_analytics.is_available(),
-                    "classification": advanced_result.get('classification') if advanced_result else None,
-                    "risk_score": advanced_result.get('risk_score') if advanced_result else None,
-                    "confidence": advanced_result.get('confidence') if advanced_result else None,
-                    "model": advanced_analytics.IMAGE_MODEL
-                }
+    processing_time = int((time.time() - start_time) * 1000)
+    
+    return {
+        "analysis_id": str(uuid.uuid4()),
+        "timestamp": datetime.utcnow().isoformat(),
+        "filename": file.filename,
+        "comparison": {
+            "basic": {
+                "classification": basic_fused['classification'],
+                "risk_score": basic_fused['risk_score'],
+                "confidence": basic_fused['confidence'],
+                "signals": basic_fused.get('signal_values', {})
             },
-            "processing_time_ms": processing_time
-        }
-        
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+            "advanced": {
+                "available": advanced_analytics.is_available(),
+                "classification": advanced_result.get('classification') if advanced_result else None,
+                "risk_score": advanced_result.get('risk_score') if advanced_result else None,
+                "confidence": advanced_result.get('confidence') if advanced_result else None,
+                "model": advanced_analytics.IMAGE_MODEL
+            }
+        },
+        "processing_time_ms": processing_time
+    }
 
 
 @router.post("/audio/")
-async def analyze_audio_advanced(file: UploadFile = File(...)):
+async def analyze_audio_advanced(upload: Upload = Depends(audio_upload)):
     """
     Analyze audio using Enhanced settings.
     
@@ -278,33 +486,21 @@ async def analyze_audio_advanced(file: UploadFile = File(...)):
     """
     start_time = time.time()
     
-    # Imports
-    from app.services.audio_detector import audio_detector
-    
-    # Validate
-    if not file.filename:
-        raise HTTPException(400, "No filename provided")
-    
-    ext = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
-    if ext not in settings.SUPPORTED_AUDIO_FORMATS:
-        raise HTTPException(400, f"Unsupported format: {ext}")
+    if not _LOCAL_AVAILABLE:
+        raise HTTPException(503, "Local audio detector not available")
     
-    contents = await file.read()
-    if len(contents) > settings.MAX_FILE_SIZE:
-        raise HTTPException(413, "File too large")
+    file, contents, ext = upload
     
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(contents)
-        tmp_path = tmp.name
+    in_memory = ext in audio_detector.FILE_OBJECT_FORMATS
     
-    try:
+    with _upload_source(contents, ext, in_memory) as audio_source:
         logger.info(f"Enhanced Audio Analytics (Using Local): {file.filename}")
         
         # Use Local Audio Detector
         if not audio_detector.is_loaded():
              audio_detector.load_model()
              
-        result = audio_detector.analyze(tmp_path)
+        result = audio_detector.analyze(audio_source)
         
         if 'error' in result and not result.get('prediction'):
             raise HTTPException(500, f"Analysis failed: {result['error']}")
@@ -332,15 +528,11 @@ async def analyze_audio_advanced(file: UploadFile = File(...)):
             "audio_features": result.get('audio_features', {}),
             "processing_time_ms": processing_time
         }
-        
-    finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
 
 
 @router.post("/video/")
 async def analyze_video_advanced(
-    file: UploadFile = File(...),
+    upload: UploadRef = Depends(video_upload),
     max_frames: int = Query(5, ge=1, le=10, description="Max frames to analyze")
 ):
     """
@@ -359,133 +551,22 @@ async def analyze_video_advanced(
             "Enhanced AI not available. NVIDIA_API_KEY not set."
         )
     
-    if not file.filename:
-        raise HTTPException(400, "No filename provided")
+    file, ext = upload
     
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in ['.mp4', '.avi', '.mov', '.webm', '.mkv']:
-        raise HTTPException(400, f"Unsupported video format: {ext}")
-    
-    contents = await file.read()
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(contents)
-        video_path = tmp.name
-    
-    # Grand Ensemble for Video
-    
-    # Imports for local models
-    try:
-        from app.services.temporal_detector import temporal_detector
-    except ImportError:
-        pass
+    # Stream to disk and hash in one pass; the video is never held in memory
+    hasher = result_cache.content_hasher()
+    async with spooled_upload_path(file, ext, hasher=hasher) as video_path:
+        cache_key = result_cache.make_key_from_digest("advanced_video", hasher.hexdigest(), max_frames)
+        result = result_cache.get(cache_key)
+        cached = result is not None
         
-    ensemble_scores = []
-    signals = {}
+        if not cached:
+            result, complete = await _video_ensemble(video_path, max_frames)
+            if complete:
+                result_cache.set(cache_key, result)
     
-    # 1. NVIDIA Hive
-    if nvidia_hive.is_available():
-        try:
-            res_nv = nvidia_hive.analyze_video(video_path, num_frames=max_frames)
-            if 'error' not in res_nv:
-                score = res_nv.get('risk_score', 50)
-                ensemble_scores.append(score)
-                signals['nvidia_hive'] = {
-                    'risk_score': score,
-                    'classification': res_nv.get('classification')
-                }
-        except Exception as e:
-            logger.error(f"NVIDIA Video failed: {e}")
-            
-    # 2. HuggingFace (Sample 3 frames)
-    if advanced_analytics.is_available():
-        try:
-            import cv2
-            import numpy as np
-            cap = cv2.VideoCapture(video_path)
-            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            indices = np.linspace(0, total-1, 3, dtype=int)
-            
-            hf_scores = []
-            for i in indices:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-                ret, frame = cap.read()
-                if ret:
-                    # Save frame temp
-                    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tf:
-                        cv2.imwrite(tf.name, frame)
-                        tf_path = tf.name
-                        
-                    try:
-                        res = advanced_analytics.analyze_image(tf_path)
-                        if 'risk_score' in res:
-                            hf_scores.append(res['risk_score'])
-                    finally:
-                        if os.path.exists(tf_path):
-                            os.unlink(tf_path)
-            cap.release()
-            
-            if hf_scores:
-                avg_hf = sum(hf_scores) / len(hf_scores)
-                ensemble_scores.append(avg_hf)
-                signals['huggingface'] = {'risk_score': avg_hf, 'frames_sampled': len(hf_scores)}
-                
-        except Exception as e:
-            logger.error(f"HF Video failed: {e}")
-            
-    # 3. Local Temporal Model
-    try:
-        res_temp = temporal_detector.analyze(video_path)
-        if 'error' not in res_temp:
-            score = res_temp.get('risk_score', 50)
-            ensemble_scores.append(score)
-            signals['local_temporal'] = {
-                'risk_score': score,
-                'classification': res_temp.get('classification')
-            }
-    except Exception as e:
-        logger.error(f"Local Temporal failed: {e}")
-        
-    if not ensemble_scores:
-        raise HTTPException(500, "All video analysis methods failed")
-        
-    # Weighted Ensemble: NVIDIA=30%, HuggingFace=35%, Local Temporal=35%
-    weighted_sum = 0.0
-    total_weight = 0.0
-    
-    if 'nvidia_hive' in signals:
-        nvidia_score = signals['nvidia_hive']['risk_score']
-        weighted_sum += nvidia_score * 0.30
-        total_weight += 0.30
-    
-    if 'huggingface' in signals:
-        hf_score = signals['huggingface']['risk_score']
-        weighted_sum += hf_score * 0.35
-        total_weight += 0.35
-    
-    if 'local_temporal' in signals:
-        local_score = signals['local_temporal']['risk_score']
-        weighted_sum += local_score * 0.35
-        total_weight += 0.35
-    
-    if total_weight > 0:
-        avg_risk = weighted_sum / total_weight
-    else:
-        avg_risk = sum(ensemble_scores) / len(ensemble_scores)
-    
-    if avg_risk >= 70:
-        classification = "MANIPULATED"
-    elif avg_risk >= 40:
-        classification = "SUSPICIOUS"
-    else:
-        classification = "AUTHENTIC"
-        
     processing_time = int((time.time() - start_time) * 1000)
     
-    # Cleanup
-    if os.path.exists(video_path):
-        os.unlink(video_path)
-        
     return {
         "analysis_id": str(uuid.uuid4()),
         "timestamp": datetime.utcnow().isoformat(),
@@ -493,13 +574,7 @@ async def analyze_video_advanced(
         "filename": file.filename,
         "mode": "enhanced_ensemble",
         "model": "Ensemble (NVIDIA 30% + HF 35% + Local 35%)",
-        "classification": classification,
-        "confidence": "HIGH",
-        "risk_score": round(avg_risk, 2),
-        "prediction": {
-            "fake_probability": avg_risk / 100,
-            "real_probability": 1 - (avg_risk / 100)
-        },
-        "signals": signals,
+        **result,
+        "cached": cached,
         "processing_time_ms": processing_time
     }
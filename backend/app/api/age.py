@@ -12,12 +12,12 @@ import logging
 from datetime import datetime
 from typing import Tuple
 
-import cv2
 import numpy as np
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, BackgroundTasks, File, UploadFile, HTTPException
 
 from app.services.age_estimator import age_estimator
 from app.database.storage import storage_service
+from app.api._uploads import read_bounded, decode_image_bgr
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +25,12 @@ router = APIRouter()
 
 
 async def load_image_from_upload(file: UploadFile) -> Tuple[np.ndarray, bytes]:
-    """Load and decode image from upload. Returns (image_array, raw_bytes)."""
-    contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    """Load and decode image (BGR, as the models consume it) from upload. Returns (image_array, raw_bytes)."""
+    contents = await read_bounded(file)
+    image = decode_image_bgr(contents)
     
     if image is None:
         raise HTTPException(400, f"Could not decode image: {file.filename}")
-    
-    # Convert BGR to RGB
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     return image, contents
 
 
@@ -49,7 +45,10 @@ async def get_status():
 
 
 @router.post("/estimate")
-async def estimate_age(file: UploadFile = File(..., description="Face image")):
+async def estimate_age(
+    background: BackgroundTasks,
+    file: UploadFile = File(..., description="Face image")
+):
     """
     Estimate age from facial features.
     
@@ -63,7 +62,7 @@ async def estimate_age(file: UploadFile = File(..., description="Face image")):
     
     try:
         image, raw_bytes = await load_image_from_upload(file)
-        result = age_estimator.estimate(image)
+        result = age_estimator.estimate(image, is_bgr=True)
         
         processing_time = int((time.time() - start_time) * 1000)
         
@@ -76,8 +75,9 @@ async def estimate_age(file: UploadFile = File(..., description="Face image")):
             "processing_time_ms": processing_time
         }
         
-        # Save to MongoDB
-        await storage_service.save_biometric_data(
+        # Persist after the response is sent so Mongo latency stays off the request
+        background.add_task(
+            storage_service.save_biometric_data,
             service_type="age",
             image_bytes=raw_bytes,
             result=response,
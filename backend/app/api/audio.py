@@ -1,35 +1,20 @@
 """Audio analysis API endpoint."""
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from datetime import datetime
 import uuid
 import time
-import tempfile
-import os
 import logging
 
 from app.services.audio_detector import audio_detector
 from app.models.response import AudioAnalysisResponse
-from app.config import settings
+from app.api._uploads import Upload, audio_upload, upload_tempfile
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def validate_audio_file(file: UploadFile) -> None:
-    """Validate uploaded audio file."""
-    if not file.filename:
-        raise HTTPException(400, "No filename provided")
-    
-    ext = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
-    if ext not in settings.SUPPORTED_AUDIO_FORMATS:
-        raise HTTPException(
-            400, 
-            f"Unsupported format. Supported: {settings.SUPPORTED_AUDIO_FORMATS}"
-        )
-
-
 @router.post("/", response_model=AudioAnalysisResponse)
-async def analyze_audio(file: UploadFile = File(...)):
+async def analyze_audio(upload: Upload = Depends(audio_upload)):
     """
     Analyze an audio file for synthetic voice detection.
     
@@ -42,20 +27,10 @@ async def analyze_audio(file: UploadFile = File(...)):
     """
     start_time = time.time()
     
-    # Validate file
-    validate_audio_file(file)
+    # Validated and read by the dependency; save to temp file
+    file, contents, ext = upload
     
-    # Save to temp file
-    ext = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else '.wav'
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        contents = await file.read()
-        if len(contents) > settings.MAX_FILE_SIZE:
-            raise HTTPException(413, f"File too large. Max: {settings.MAX_FILE_SIZE // (1024*1024)}MB")
-        tmp.write(contents)
-        audio_path = tmp.name
-    
-    try:
+    with upload_tempfile(contents, ext) as audio_path:
         logger.info(f"Analyzing audio: {file.filename}")
         
         # Run audio analysis
@@ -110,8 +85,3 @@ async def analyze_audio(file: UploadFile = File(...)):
             audio_features=audio_features,
             processing_time_ms=processing_time
         )
-        
-    finally:
-        # Cleanup
-        if os.path.exists(audio_path):
-            os.unlink(audio_path)
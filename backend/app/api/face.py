@@ -10,16 +10,17 @@ Provides:
 
 import os
 import time
+import base64
 import uuid
 import logging
 from datetime import datetime
 from typing import Optional
 
-import cv2
 import numpy as np
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form
 
 from app.services.face_recognition import face_recognition_service
+from app.api._uploads import read_bounded, decode_image_bgr
 
 logger = logging.getLogger(__name__)
 
@@ -27,16 +28,12 @@ router = APIRouter()
 
 
 async def load_image_from_upload(file: UploadFile) -> np.ndarray:
-    """Load and decode image from upload."""
-    contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    """Load and decode image (BGR, as the models consume it) from upload."""
+    contents = await read_bounded(file)
+    image = decode_image_bgr(contents)
     
     if image is None:
         raise HTTPException(400, f"Could not decode image: {file.filename}")
-    
-    # Convert BGR to RGB
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     return image
 
 
@@ -66,7 +63,7 @@ async def detect_faces(file: UploadFile = File(...)):
     
     try:
         image = await load_image_from_upload(file)
-        faces = face_recognition_service.detect_faces(image)
+        faces = face_recognition_service.detect_faces(image, is_bgr=True)
         
         processing_time = int((time.time() - start_time) * 1000)
         
@@ -117,7 +114,7 @@ async def match_faces(
         image2 = await load_image_from_upload(file2)
         
         # Perform matching
-        result = face_recognition_service.match_faces(image1, image2, threshold)
+        result = face_recognition_service.match_faces(image1, image2, threshold, is_bgr=True)
         
         processing_time = int((time.time() - start_time) * 1000)
         
@@ -142,9 +139,11 @@ async def match_faces(
 @router.post("/embedding")
 async def extract_embedding(file: UploadFile = File(...)):
     """
-    Extract 512-dimensional face embedding.
+    Extract face embedding.
     
     Useful for storing faces in a database for later identification.
+    The vector is returned as base64-encoded little-endian float16 bytes;
+    decode with `np.frombuffer(base64.b64decode(s), dtype=np.float16)`.
     """
     if not face_recognition_service.is_available():
         raise HTTPException(503, "Face Recognition service not available")
@@ -153,7 +152,8 @@ async def extract_embedding(file: UploadFile = File(...)):
     
     try:
         image = await load_image_from_upload(file)
-        embedding = face_recognition_service.get_embedding(image)
+        result = face_recognition_service.get_embedding(image, is_bgr=True)
+        embedding = result.get("embedding")
         
         processing_time = int((time.time() - start_time) * 1000)
         
@@ -163,18 +163,23 @@ async def extract_embedding(file: UploadFile = File(...)):
                 "timestamp": datetime.utcnow().isoformat(),
                 "filename": file.filename,
                 "success": False,
-                "error": "No face detected in image",
-                "embedding": None,
+                "error": result.get("error", "No face detected in image"),
+                "embedding_b64": None,
                 "processing_time_ms": processing_time
             }
         
+        # FP16 is ample for cosine matching and ~8x smaller than a JSON float list
+        emb16 = np.asarray(embedding, dtype="<f2")
+        
         return {
             "request_id": str(uuid.uuid4()),
             "timestamp": datetime.utcnow().isoformat(),
             "filename": file.filename,
             "success": True,
-            "embedding_dimension": 512,
-            "embedding": embedding.tolist(),
+            "model": result.get("model"),
+            "embedding_dimension": int(emb16.size),
+            "dtype": "float16",
+            "embedding_b64": base64.b64encode(emb16.tobytes()).decode("ascii"),
             "processing_time_ms": processing_time
         }
         
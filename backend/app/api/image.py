@@ -1,59 +1,59 @@
 """Image analysis API endpoint."""
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request
+from fastapi import APIRouter, Depends, Query, Request
+from pydantic import ValidationError
 from datetime import datetime
-import numpy as np
-import cv2
+from typing import Optional
+import asyncio
 import uuid
 import time
 import logging
 
+from app.config import settings
 from app.services.visual_detector import visual_detector
 from app.services.forensic_analyzer import forensic_analyzer
 from app.services.fusion_engine import fusion_engine
 from app.services.explainer import explainer
 from app.models.response import ImageAnalysisResponse, FaceDetection, Explanation
-from app.config import settings
 from app.database.storage import storage_service
+from app.api._uploads import ImageUpload, validated_image
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def validate_image_file(file: UploadFile) -> None:
-    """Validate uploaded image file."""
-    if not file.filename:
-        raise HTTPException(400, "No filename provided")
-    
-    ext = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
-    if ext not in settings.SUPPORTED_IMAGE_FORMATS:
-        raise HTTPException(
-            400, 
-            f"Unsupported format. Supported: {settings.SUPPORTED_IMAGE_FORMATS}"
-        )
+async def _save_upload(**kwargs) -> Optional[dict]:
+    """Store the upload, logging (not raising) on failure."""
+    try:
+        upload_doc = await storage_service.save_upload(**kwargs)
+        if upload_doc:
+            logger.info(f"Saved upload to database: {upload_doc['_id']}")
+        return upload_doc
+    except Exception as e:
+        logger.warning(f"Failed to save upload to database: {e}")
+        return None
 
 
-async def load_image_from_upload(file: UploadFile) -> tuple:
-    """Load image from upload file. Returns (image_array, raw_contents)."""
-    contents = await file.read()
-    
-    if len(contents) > settings.MAX_FILE_SIZE:
-        raise HTTPException(413, f"File too large. Max: {settings.MAX_FILE_SIZE // (1024*1024)}MB")
-    
-    # Decode image
-    nparr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    
-    if image is None:
-        raise HTTPException(400, "Could not decode image")
-    
-    # Convert BGR to RGB
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-    return image, contents
+def _has_plots(stored: dict) -> bool:
+    """Whether a stored analysis carries the forensic plots."""
+    local = (stored.get('signals') or {}).get('local_ensemble') or {}
+    return bool((local.get('forensic_plots') or {}).get('ela'))
+
+
+def _pipeline_version() -> str:
+    """Version of the models and pipeline behind a standard image verdict."""
+    return "|".join((
+        settings.ANALYSIS_PIPELINE_VERSION,
+        str(visual_detector.model_version),
+        forensic_analyzer.model_version
+    ))
 
 
 @router.post("/", response_model=ImageAnalysisResponse)
-async def analyze_image(file: UploadFile = File(...), request: Request = None):
+async def analyze_image(
+    upload: ImageUpload = Depends(validated_image),
+    include_plots: bool = Query(True, description="Generate the ELA and spectrum forensic plots"),
+    request: Request = None
+):
     """
     Analyze an image for deepfake detection.
     
@@ -63,11 +63,8 @@ async def analyze_image(file: UploadFile = File(...), request: Request = None):
     """
     start_time = time.time()
     
-    # Validate file
-    validate_image_file(file)
-    
-    # Load image (and keep raw contents for storage)
-    image, file_contents = await load_image_from_upload(file)
+    # Validated, read and decoded by the dependency (raw contents kept for storage)
+    file, file_contents, _, image = upload
     
     logger.info(f"Analyzing image: {file.filename}, shape: {image.shape}")
     
@@ -76,25 +73,44 @@ async def analyze_image(file: UploadFile = File(...), request: Request = None):
     if request:
         session_id = request.headers.get("X-Session-ID")
     
-    # Save upload to database (async, non-blocking)
-    upload_doc = None
-    try:
-        upload_doc = await storage_service.save_upload(
-            file_content=file_contents,
-            filename=file.filename or "unknown",
-            content_type=file.content_type or "image/jpeg",
-            session_id=session_id
-        )
-        if upload_doc:
-            logger.info(f"Saved upload to database: {upload_doc['_id']}")
-    except Exception as e:
-        logger.warning(f"Failed to save upload to database: {e}")
-    
-    # 1. Run Visual Analysis (ViT)
-    visual_result = visual_detector.analyze(image)
-    
-    # 2. Run Forensic Analysis
-    forensic_result = forensic_analyzer.analyze(image)
+    # Identical bytes already analysed: serve the stored result and skip
+    # both models entirely, as long as the same models produced it
+    file_hash = await storage_service.hash_content(file_contents)
+    pipeline_version = _pipeline_version()
+    stored = await storage_service.find_cached_analysis(
+        file_hash, mode="standard", pipeline_version=pipeline_version
+    )
+    # A result stored without plots cannot answer a request that wants them
+    if stored is not None and (not include_plots or _has_plots(stored)):
+        try:
+            response = ImageAnalysisResponse.model_validate(stored)
+            # The verdict is reused; the identity belongs to this request
+            # (the stored one may be another uploader's)
+            response.analysis_id = str(uuid.uuid4())
+            response.timestamp = datetime.utcnow()
+            response.filename = file.filename or "unknown"
+            response.processing_time_ms = int((time.time() - start_time) * 1000)
+            logger.info(f"Analysis cache hit for {file.filename} ({file_hash[:12]})")
+            return response
+        except ValidationError as e:
+            logger.warning(f"Ignoring unreadable cached analysis: {e}")
+    
+    # Save upload to database in the background so disk + Mongo I/O overlaps
+    # with inference; it is only awaited before the analysis result is stored
+    upload_task = asyncio.create_task(_save_upload(
+        file_content=file_contents,
+        filename=file.filename or "unknown",
+        content_type=file.content_type or "image/jpeg",
+        session_id=session_id,
+        file_hash=file_hash
+    ))
+    
+    # 1 + 2. Run Visual (ViT) and Forensic analysis concurrently; they are
+    # independent and both release the GIL in native code
+    visual_result, forensic_result = await asyncio.gather(
+        asyncio.to_thread(visual_detector.analyze, image),
+        asyncio.to_thread(forensic_analyzer.analyze, image, include_plots)
+    )
     
     # 3. Fuse signals (Ensemble)
     fused_result = fusion_engine.fuse_image_signals(visual_result, forensic_result)
@@ -105,15 +121,15 @@ async def analyze_image(file: UploadFile = File(...), request: Request = None):
     )
     
     # Build face detections
-    face_detections = []
-    if 'face_predictions' in visual_result:
-        for fp in visual_result.get('face_predictions', []):
-            face_detections.append(FaceDetection(
-                face_id=fp.get('face_id', 0),
-                bbox=fp.get('bbox', [0, 0, 0, 0]),
-                detection_confidence=fp.get('detection_confidence', 0.0),
-                fake_probability=fp.get('fake_probability')
-            ))
+    face_detections = [
+        FaceDetection(
+            face_id=fp.get('face_id', 0),
+            bbox=fp.get('bbox', [0, 0, 0, 0]),
+            detection_confidence=fp.get('detection_confidence', 0.0),
+            fake_probability=fp.get('fake_probability')
+        )
+        for fp in visual_result.get('face_predictions') or ()
+    ]
     
     # Build signals dict
     signals = {}
@@ -145,50 +161,39 @@ async def analyze_image(file: UploadFile = File(...), request: Request = None):
     
     processing_time = int((time.time() - start_time) * 1000)
     
-    # Build response
-    analysis_id = str(uuid.uuid4())
-    
-    response_data = {
-        "analysis_id": analysis_id,
-        "timestamp": datetime.utcnow(),
-        "media_type": "image",
-        "filename": file.filename or "unknown",
-        "classification": fused_result['classification'],
-        "confidence": fused_result['confidence'],
-        "risk_score": fused_result['risk_score'],
-        "prediction": {
+    # Build the response model once; it is both stored and returned
+    response = ImageAnalysisResponse(
+        analysis_id=str(uuid.uuid4()),
+        timestamp=datetime.utcnow(),
+        media_type="image",
+        filename=file.filename or "unknown",
+        classification=fused_result['classification'],
+        confidence=fused_result['confidence'],
+        risk_score=fused_result['risk_score'],
+        prediction={
             "fake_probability": fused_result['risk_score'] / 100.0,
             "real_probability": 1.0 - (fused_result['risk_score'] / 100.0)
         },
-        "signals": signals,
-        "face_detections": face_detections,
-        "explanation": explanation_result,
-        "processing_time_ms": processing_time
-    }
+        signals=signals,
+        face_detections=face_detections,
+        explanation=Explanation(**explanation_result),
+        processing_time_ms=processing_time
+    )
     
-    # Save analysis result to database
+    # Save analysis result to database (storage serializes it through orjson,
+    # so the timestamp is stored as an ISO string; analyzed_at is the typed
+    # datetime for queries)
+    upload_doc = await upload_task
     if upload_doc:
         try:
             await storage_service.save_analysis_result(
                 upload_id=upload_doc['_id'],
-                result=response_data,
-                mode="standard"
+                result=response.model_dump(),
+                mode="standard",
+                pipeline_version=pipeline_version
             )
             logger.info(f"Saved analysis result for upload: {upload_doc['_id']}")
         except Exception as e:
             logger.warning(f"Failed to save analysis result: {e}")
     
-    return ImageAnalysisResponse(
-        analysis_id=analysis_id,
-        timestamp=response_data["timestamp"],
-        media_type="image",
-        filename=response_data["filename"],
-        classification=response_data["classification"],
-        confidence=response_data["confidence"],
-        risk_score=response_data["risk_score"],
-        prediction=response_data["prediction"],
-        signals=signals,
-        face_detections=face_detections,
-        explanation=Explanation(**explanation_result),
-        processing_time_ms=processing_time
-    )
+    return response
@@ -12,12 +12,12 @@ import logging
 from datetime import datetime
 from typing import Tuple
 
-import cv2
 import numpy as np
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
+from fastapi import APIRouter, BackgroundTasks, File, UploadFile, HTTPException, Form
 
 from app.services.liveness_detector import liveness_detector
 from app.database.storage import storage_service
+from app.api._uploads import read_bounded, decode_image_bgr
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +25,12 @@ router = APIRouter()
 
 
 async def load_image_from_upload(file: UploadFile) -> Tuple[np.ndarray, bytes]:
-    """Load and decode image from upload. Returns (image_array, raw_bytes)."""
-    contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    """Load and decode image (BGR, as the detector consumes it) from upload. Returns (image_array, raw_bytes)."""
+    contents = await read_bounded(file)
+    image = decode_image_bgr(contents)
     
     if image is None:
         raise HTTPException(400, f"Could not decode image: {file.filename}")
-    
-    # Convert BGR to RGB
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     return image, contents
 
 
@@ -51,6 +47,7 @@ async def get_status():
 
 @router.post("/detect")
 async def detect_liveness(
+    background: BackgroundTasks,
     file: UploadFile = File(..., description="Face image to analyze"),
     security_level: str = Form("standard", description="Security level: standard, high, banking_kyc")
 ):
@@ -72,7 +69,7 @@ async def detect_liveness(
     
     try:
         image, raw_bytes = await load_image_from_upload(file)
-        result = liveness_detector.detect(image, security_level)
+        result = liveness_detector.detect(image, security_level, is_bgr=True)
         
         processing_time = int((time.time() - start_time) * 1000)
         
@@ -85,8 +82,9 @@ async def detect_liveness(
             "processing_time_ms": processing_time
         }
         
-        # Save to MongoDB (async, don't wait)
-        await storage_service.save_biometric_data(
+        # Persist after the response is sent so Mongo latency stays off the request
+        background.add_task(
+            storage_service.save_biometric_data,
             service_type="liveness",
             image_bytes=raw_bytes,
             result=response,
@@ -1,11 +1,10 @@
 """Video analysis API endpoint."""
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from fastapi import APIRouter, Depends, Query
 from datetime import datetime
 import numpy as np
 import cv2
 import uuid
 import time
-import tempfile
 import os
 import logging
 
@@ -16,25 +15,12 @@ from app.services.audio_detector import audio_detector
 from app.services.fusion_engine import fusion_engine
 from app.services.explainer import explainer
 from app.models.response import VideoAnalysisResponse, FrameAnalysis, Explanation
-from app.config import settings
+from app.api._uploads import UploadRef, video_upload, spooled_upload_path
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def validate_video_file(file: UploadFile) -> None:
-    """Validate uploaded video file."""
-    if not file.filename:
-        raise HTTPException(400, "No filename provided")
-    
-    ext = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
-    if ext not in settings.SUPPORTED_VIDEO_FORMATS:
-        raise HTTPException(
-            400, 
-            f"Unsupported format. Supported: {settings.SUPPORTED_VIDEO_FORMATS}"
-        )
-
-
 def extract_frames(video_path: str, num_frames: int = 16) -> tuple:
     """Extract frames from video uniformly."""
     cap = cv2.VideoCapture(video_path)
@@ -93,7 +79,7 @@ def extract_audio(video_path: str, output_path: str) -> bool:
 
 @router.post("/", response_model=VideoAnalysisResponse)
 async def analyze_video(
-    file: UploadFile = File(...),
+    upload: UploadRef = Depends(video_upload),
     num_frames: int = Query(default=16, ge=4, le=32, description="Number of frames to analyze")
 ):
     """
@@ -104,22 +90,13 @@ async def analyze_video(
     """
     start_time = time.time()
     
-    # Validate file
-    validate_video_file(file)
-    
-    # Save to temp file
-    ext = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else '.mp4'
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        contents = await file.read()
-        if len(contents) > settings.MAX_FILE_SIZE:
-            raise HTTPException(413, f"File too large. Max: {settings.MAX_FILE_SIZE // (1024*1024)}MB")
-        tmp.write(contents)
-        video_path = tmp.name
+    # Validated by the dependency; stream the body straight to a temp file
+    file, ext = upload
     
-    audio_path = video_path.replace(ext, '.wav')
-    
-    try:
+    async with spooled_upload_path(file, ext) as video_path:
+        # Extracted audio lives in the same per-request directory
+        audio_path = os.path.join(os.path.dirname(video_path), "audio.wav")
+        
         logger.info(f"Analyzing video: {file.filename}")
         
         # 1. Run Temporal Analysis (Main Detector)
@@ -132,13 +109,14 @@ async def analyze_video(
         frame_analyses = []
         frame_results = []
         
-        for i, (frame, ts) in enumerate(zip(frames, timestamps)):
+        # Forensic analysis (Frequency) for all frames in one batched pass
+        # (per-frame plots are never returned, so none are generated)
+        forensic_results = forensic_analyzer.analyze_batch(frames)
+        
+        for i, (frame, ts, forensic_result) in enumerate(zip(frames, timestamps, forensic_results)):
             # Visual analysis (Spatial)
             visual_result = visual_detector.analyze(frame)
             
-            # Forensic analysis (Frequency)
-            forensic_result = forensic_analyzer.analyze(frame)
-            
             # Fuse for this frame (Ensemble)
             fused = fusion_engine.fuse_image_signals(visual_result, forensic_result)
             
@@ -227,10 +205,3 @@ async def analyze_video(
             explanation=Explanation(**explanation_result),
             processing_time_ms=processing_time
         )
-        
-    finally:
-        # Cleanup temp files
-        if os.path.exists(video_path):
-            os.unlink(video_path)
-        if os.path.exists(audio_path):
-            os.unlink(audio_path)
@@ -30,12 +30,48 @@ class Settings(BaseSettings):
     
     # Processing
     MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 100MB
+    UPLOAD_SPOOL_SIZE: int = 8 * 1024 * 1024  # Temp uploads below 8MB stay in memory
     SUPPORTED_IMAGE_FORMATS: List[str] = [".jpg", ".jpeg", ".png", ".webp", ".bmp"]
     SUPPORTED_VIDEO_FORMATS: List[str] = [".mp4", ".avi", ".mov", ".webm", ".mkv"]
     SUPPORTED_AUDIO_FORMATS: List[str] = [".wav", ".mp3", ".m4a", ".flac", ".ogg"]
+    # Upload dedup / stored-verdict lookup hash: "sha256", "blake2b", or
+    # "xxh3" (non-cryptographic, needs xxhash; trusted uploaders only)
+    UPLOAD_DEDUP_HASH: str = "sha256"
+    
+    # Result cache (identical re-uploads skip the ensemble)
+    RESULT_CACHE_MAX_ENTRIES: int = 256  # 0 disables caching
+    RESULT_CACHE_TTL_SECONDS: int = 600
+    FACE_EMBEDDING_CACHE_SIZE: int = 1024  # Face embeddings memoized per image content; 0 disables
+    VISUAL_RESULT_CACHE_SIZE: int = 512  # ViT probabilities memoized per preprocessed input; 0 disables
+    STORE_RAW_RESPONSES: bool = True  # Keep compressed full responses in Mongo (replays repeat uploads)
+    # Bump when preprocessing or fusion changes so stored verdicts are not replayed;
+    # model file swaps (ONNX/INT8/re-export) are detected automatically
+    ANALYSIS_PIPELINE_VERSION: str = "1"
+    
+    # Image ensemble early exit: return without waiting for the remote
+    # branches (started alongside local) when the HIGH-confidence local
+    # fusion holds its label whatever the remotes score. Saves latency only;
+    # the remote calls still run
+    ENSEMBLE_EARLY_EXIT: bool = False
+    
+    # Optional cap (longer side, pixels) on the image liveness texture/blur/
+    # colour/moire analysis runs on; 0 = full resolution. The texture, blur
+    # (Laplacian variance 50/2000) and moire thresholds are tuned at full
+    # resolution and depend on pixel scale, so a cap shifts every score and
+    # makes results depend on input size; retune them before enabling it
+    LIVENESS_ANALYSIS_MAX_SIDE: int = 0
+    # Skip the FFT moire check when the other analyses already decide the result
+    LIVENESS_EARLY_EXIT: bool = True
+    # OpenCV YuNet face detector in MODELS_DIR; the Haar/DeepFace path is used when absent
+    LIVENESS_FACE_MODEL: str = "face_detection_yunet_2023mar.onnx"
     
     # Inference
     USE_GPU: bool = False  # Set to True if you have GPU
+    # Prefer *_int8.onnx from scripts/quantize_models.py when present; off by
+    # default since quantized accuracy is not checked automatically
+    USE_INT8_MODELS: bool = False
+    ORT_PROVIDERS: List[str] = []  # Explicit ONNX Runtime providers; empty = derive from USE_GPU
+    TRT_CACHE: str = "trt_cache"  # TensorRT engine cache, relative to MODELS_DIR
     
     # Fusion weights
     VISUAL_WEIGHT: float = 0.45
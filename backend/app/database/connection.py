@@ -5,7 +5,7 @@ Provides async MongoDB connection using Motor driver
 import os
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import ServerSelectionTimeoutError
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
 
 logger = logging.getLogger(__name__)
 
@@ -86,10 +86,25 @@ class Database:
             await cls.db[cls.SESSIONS].create_index("session_token", unique=True)
             await cls.db[cls.SESSIONS].create_index("started_at")
             
-            # Analytics indexes
-            await cls.db[cls.ANALYTICS].create_index("session_id")
-            await cls.db[cls.ANALYTICS].create_index("event_type")
-            await cls.db[cls.ANALYTICS].create_index("timestamp")
+            # Analytics indexes: events expire so the collection and its
+            # indexes stay bounded; (session_id, timestamp) serves per-session
+            # queries in time order and replaces the single session_id index
+            analytics = cls.db[cls.ANALYTICS]
+            ttl_seconds = int(os.getenv("ANALYTICS_TTL_DAYS", "30")) * 24 * 60 * 60
+            await analytics.create_index([("session_id", 1), ("timestamp", 1)])
+            await analytics.create_index("event_type")
+            try:
+                await analytics.create_index("timestamp", expireAfterSeconds=ttl_seconds)
+            except OperationFailure:
+                # Existing plain or differently-timed index: convert in place
+                await cls.db.command(
+                    "collMod", cls.ANALYTICS,
+                    index={"keyPattern": {"timestamp": 1}, "expireAfterSeconds": ttl_seconds}
+                )
+            try:
+                await analytics.drop_index("session_id_1")
+            except OperationFailure:
+                pass  # Already dropped
             
             logger.info("Database indexes created")
         except Exception as e:
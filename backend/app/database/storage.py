@@ -2,19 +2,89 @@
 Storage Service for handling file uploads and analysis persistence
 """
 import os
+import asyncio
 import hashlib
 import uuid
-import base64
 import zlib
+from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, Dict, Any, BinaryIO
+from typing import Optional, Dict, Any, BinaryIO, Tuple
 import logging
 
+import orjson
+from bson.binary import Binary
+from pymongo import UpdateOne
+
+from app.config import settings
 from .connection import Database
 
 logger = logging.getLogger(__name__)
 
+# file_hash keys upload dedup and stored-verdict replay, so it must resist
+# crafted collisions: SHA-256 by default, BLAKE2b when hashing speed matters.
+# xxh3-128 is opt-in only; it is fast but a collision can be constructed.
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+if settings.UPLOAD_DEDUP_HASH == "xxh3" and XXHASH_AVAILABLE:
+    DEDUP_HASH = "xxh3_128"
+elif settings.UPLOAD_DEDUP_HASH == "blake2b":
+    DEDUP_HASH = "blake2b"
+else:
+    DEDUP_HASH = "sha256"
+
+
+# Upload classification: one dict probe instead of scanning extension lists
+_EXT_TO_TYPE = {
+    **dict.fromkeys(('.jpg', '.jpeg', '.png', '.webp', '.gif'), "image"),
+    **dict.fromkeys(('.mp4', '.avi', '.mov', '.webm', '.mkv'), "video"),
+    **dict.fromkeys(('.mp3', '.wav', '.m4a', '.flac', '.ogg'), "audio"),
+}
+_MIME_PREFIX_TO_TYPE = {"image": "image", "video": "video", "audio": "audio"}
+
+
+def _encode_result(value: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Serialize an analysis payload once for storage.
+    
+    Results can hold numpy scalars/arrays that BSON cannot encode; a single
+    orjson pass converts them (datetimes become ISO strings). The same JSON
+    bytes are zlib-compressed for the stored raw response blob.
+    
+    Returns: (BSON-safe dict, compressed JSON)
+    """
+    encoded = orjson.dumps(
+        value,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        default=_orjson_default
+    )
+    return orjson.loads(encoded), zlib.compress(encoded, level=1)
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Fallback for types orjson does not know (e.g. pydantic models)."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"{type(obj).__name__} is not serializable")
+
+
+def _pack_biometric_image(image_bytes: bytes) -> Tuple[bytes, str]:
+    """
+    CPU-bound part of biometric storage.
+    
+    Level 1 is used because uploads are already JPEG/PNG-compressed; higher
+    zlib levels cost several times the CPU for almost no extra reduction.
+    
+    Returns: (compressed, sha256 hex digest)
+    """
+    compressed = zlib.compress(image_bytes, level=1)
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    return compressed, image_hash
+
 
 class StorageService:
     """Service for storing files and analysis data in MongoDB"""
@@ -23,39 +93,54 @@ class StorageService:
     UPLOAD_DIR = Path("data/uploads")
     TEMP_DIR = Path("data/temp")
     
+    # Uploads smaller than this are written on the event loop
+    INLINE_WRITE_LIMIT = 64 * 1024
+    
+    # Analytics event batching
+    EVENT_QUEUE_SIZE = 10000
+    EVENT_BATCH_SIZE = 500
+    EVENT_FLUSH_INTERVAL = 0.1  # seconds
+    
     def __init__(self):
-        # Ensure directories exist
-        (self.UPLOAD_DIR / "images").mkdir(parents=True, exist_ok=True)
-        (self.UPLOAD_DIR / "videos").mkdir(parents=True, exist_ok=True)
-        (self.UPLOAD_DIR / "audio").mkdir(parents=True, exist_ok=True)
-        self.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+        self._event_queue: Optional[asyncio.Queue] = None
+        self._flusher_task: Optional[asyncio.Task] = None
+        self._flusher_stop: Optional[asyncio.Event] = None
+        
+        # Upload directories are created on first write, not at import, so
+        # read-only deployments and tests never touch the filesystem
+        self._ensured_dirs: set = set()
     
     def _get_file_hash(self, file_content: bytes) -> str:
-        """Generate SHA256 hash for deduplication"""
+        """
+        Generate the dedup hash (see DEDUP_HASH).
+        
+        SHA-256 digests are stored bare, as in existing records; other
+        algorithms are prefixed with their name so a lookup only ever
+        matches records hashed the same way.
+        """
+        if DEDUP_HASH == "xxh3_128":
+            return "xxh3_128:" + xxhash.xxh3_128_hexdigest(file_content)
+        if DEDUP_HASH == "blake2b":
+            return "blake2b:" + hashlib.blake2b(file_content, digest_size=32).hexdigest()
         return hashlib.sha256(file_content).hexdigest()
     
+    async def hash_content(self, file_content: bytes) -> str:
+        """Dedup hash, computed in a thread so large videos don't block the loop"""
+        return await asyncio.to_thread(self._get_file_hash, file_content)
+    
     def _get_date_path(self) -> str:
         """Get date-based path like 2026/01/17"""
         now = datetime.now(timezone.utc)
         return f"{now.year}/{now.month:02d}/{now.day:02d}"
     
-    def _get_file_type(self, filename: str, content_type: str) -> str:
-        """Determine file type from filename or content type"""
-        filename_lower = filename.lower()
+    def _get_file_type(self, file_ext: str, content_type: str) -> str:
+        """Determine file type from a lower-cased extension or content type"""
+        file_type = _EXT_TO_TYPE.get(file_ext)
+        if file_type:
+            return file_type
         
-        if any(filename_lower.endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif']):
-            return "image"
-        elif any(filename_lower.endswith(ext) for ext in ['.mp4', '.avi', '.mov', '.webm', '.mkv']):
-            return "video"
-        elif any(filename_lower.endswith(ext) for ext in ['.mp3', '.wav', '.m4a', '.flac', '.ogg']):
-            return "audio"
-        elif content_type:
-            if content_type.startswith('image/'):
-                return "image"
-            elif content_type.startswith('video/'):
-                return "video"
-            elif content_type.startswith('audio/'):
-                return "audio"
+        if content_type:
+            return _MIME_PREFIX_TO_TYPE.get(content_type.split('/', 1)[0], "other")
         
         return "other"
     
@@ -65,11 +150,14 @@ class StorageService:
         filename: str,
         content_type: str,
         session_id: Optional[str] = None,
-        user_id: Optional[str] = None
+        user_id: Optional[str] = None,
+        file_hash: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Save uploaded file and create database record.
         
+        Pass `file_hash` when the caller already has it from hash_content().
+        
         Returns:
             Upload document dict with id, or None if DB not connected
         """
@@ -78,26 +166,41 @@ class StorageService:
             return None
         
         try:
-            # Generate IDs and hashes
-            upload_id = str(uuid.uuid4())
-            file_hash = self._get_file_hash(file_content)
-            file_type = self._get_file_type(filename, content_type)
+            if file_hash is None:
+                file_hash = await self.hash_content(file_content)
+            
+            # Identical content is already on disk (file_hash is uniquely
+            # indexed), so reuse that record instead of writing it again
+            collection = Database.get_collection(Database.UPLOADS)
+            existing = await collection.find_one({"file_hash": file_hash})
+            if existing:
+                logger.info(f"Duplicate upload, reusing {existing['_id']}")
+                return existing
+            
+            upload_id = uuid.uuid4().hex
+            # Lower-case and split the name once for both type and stored name
+            file_ext = os.path.splitext(filename.lower())[1]
+            file_type = self._get_file_type(file_ext, content_type)
             
             # Create file path
             date_path = self._get_date_path()
-            file_ext = Path(filename).suffix.lower()
             stored_filename = f"{upload_id}{file_ext}"
             
             # Full path: data/uploads/images/2026/01/17/{uuid}.jpg
             relative_path = f"{file_type}s/{date_path}/{stored_filename}"
             full_path = self.UPLOAD_DIR / relative_path
             
-            # Ensure directory exists
-            full_path.parent.mkdir(parents=True, exist_ok=True)
+            # Ensure directory exists (once per type/day directory)
+            if full_path.parent not in self._ensured_dirs:
+                full_path.parent.mkdir(parents=True, exist_ok=True)
+                self._ensured_dirs.add(full_path.parent)
             
-            # Write file
-            with open(full_path, 'wb') as f:
-                f.write(file_content)
+            # Write file; small writes finish faster inline than the
+            # thread hand-off costs, large ones go to a worker thread
+            if len(file_content) < self.INLINE_WRITE_LIMIT:
+                full_path.write_bytes(file_content)
+            else:
+                await asyncio.to_thread(full_path.write_bytes, file_content)
             
             # Create database record
             upload_doc = {
@@ -111,12 +214,12 @@ class StorageService:
                 "mime_type": content_type,
                 "file_size_bytes": len(file_content),
                 "file_hash": file_hash,
+                "hash_algorithm": DEDUP_HASH,
                 "uploaded_at": datetime.now(timezone.utc),
                 "status": "pending"
             }
             
             # Insert into database
-            collection = Database.get_collection(Database.UPLOADS)
             await collection.insert_one(upload_doc)
             
             logger.info(f"Saved upload: {upload_id} ({file_type}, {len(file_content)} bytes)")
@@ -130,11 +233,15 @@ class StorageService:
         self,
         upload_id: str,
         result: Dict[str, Any],
-        mode: str = "standard"
+        mode: str = "standard",
+        pipeline_version: Optional[str] = None
     ) -> Optional[str]:
         """
         Save analysis result to database.
         
+        `pipeline_version` identifies the models that produced the result;
+        find_cached_analysis only replays results with a matching version.
+        
         Returns:
             Result ID or None if failed
         """
@@ -142,7 +249,8 @@ class StorageService:
             return None
         
         try:
-            result_id = str(uuid.uuid4())
+            result_id = uuid.uuid4().hex
+            result, raw_compressed = await asyncio.to_thread(_encode_result, result)
             
             analysis_doc = {
                 "_id": result_id,
@@ -157,18 +265,25 @@ class StorageService:
                 "enhanced_result": result.get("signals", {}).get("enhanced_ai"),
                 "processing_time_ms": result.get("processing_time_ms"),
                 "analysis_mode": mode,
-                "analyzed_at": datetime.now(timezone.utc),
-                "raw_response": result
+                "pipeline_version": pipeline_version,
+                "analyzed_at": datetime.now(timezone.utc)
             }
             
-            collection = Database.get_collection(Database.ANALYSIS_RESULTS)
-            await collection.insert_one(analysis_doc)
+            # The full payload (mostly base64 plots) is only needed to replay
+            # cache hits, so store it compressed rather than as a nested doc
+            if settings.STORE_RAW_RESPONSES:
+                analysis_doc["raw_response_z"] = Binary(raw_compressed)
             
-            # Update upload status
+            # Insert the result and mark the upload completed concurrently;
+            # the writes are independent and use separate pool connections
+            collection = Database.get_collection(Database.ANALYSIS_RESULTS)
             uploads = Database.get_collection(Database.UPLOADS)
-            await uploads.update_one(
-                {"_id": upload_id},
-                {"$set": {"status": "completed"}}
+            await asyncio.gather(
+                collection.insert_one(analysis_doc),
+                uploads.update_one(
+                    {"_id": upload_id},
+                    {"$set": {"status": "completed"}}
+                )
             )
             
             logger.info(f"Saved analysis result: {result_id} for upload {upload_id}")
@@ -178,6 +293,46 @@ class StorageService:
             logger.error(f"Failed to save analysis result: {e}")
             return None
     
+    async def find_cached_analysis(
+        self,
+        file_hash: str,
+        mode: str = "standard",
+        pipeline_version: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Look up the latest stored response for content with this hash,
+        produced by the same `pipeline_version` (results stored before
+        versioning, or by other models, never match).
+        
+        Returns:
+            The stored response of the newest matching analysis, or None
+            (also when STORE_RAW_RESPONSES is off)
+        """
+        if not Database.is_connected():
+            return None
+        
+        try:
+            uploads = Database.get_collection(Database.UPLOADS)
+            upload = await uploads.find_one({"file_hash": file_hash}, {"_id": 1})
+            if not upload:
+                return None
+            
+            results = Database.get_collection(Database.ANALYSIS_RESULTS)
+            hit = await results.find_one(
+                {"upload_id": upload["_id"], "analysis_mode": mode, "pipeline_version": pipeline_version},
+                {"raw_response_z": 1, "raw_response": 1},
+                sort=[("analyzed_at", -1)]
+            )
+            if not hit:
+                return None
+            if "raw_response_z" in hit:
+                return orjson.loads(zlib.decompress(hit["raw_response_z"]))
+            return hit.get("raw_response")  # documents written before compression
+            
+        except Exception as e:
+            logger.error(f"Failed to look up cached analysis: {e}")
+            return None
+    
     async def track_session(
         self,
         session_token: str,
@@ -194,7 +349,7 @@ class StorageService:
             return None
         
         try:
-            session_id = str(uuid.uuid4())
+            session_id = uuid.uuid4().hex
             
             session_doc = {
                 "_id": session_id,
@@ -216,6 +371,82 @@ class StorageService:
             logger.error(f"Failed to track session: {e}")
             return None
     
+    def start_event_flusher(self) -> None:
+        """Start the background task that batches analytics event writes."""
+        if self._flusher_task is not None:
+            return
+        self._event_queue = asyncio.Queue(maxsize=self.EVENT_QUEUE_SIZE)
+        self._flusher_stop = asyncio.Event()
+        self._flusher_task = asyncio.create_task(self._flush_events())
+    
+    async def stop_event_flusher(self) -> None:
+        """
+        Stop the flusher and write out every event still queued.
+        
+        The loop is signalled rather than cancelled, so a batch it is
+        already writing completes; it then drains the whole queue.
+        """
+        if self._flusher_task is None:
+            return
+        self._flusher_stop.set()
+        await self._flusher_task
+        self._flusher_task = None
+        self._flusher_stop = None
+        
+        # Events queued while the final drain was writing
+        while batch := self._drain_events():
+            await self._write_events(batch)
+        self._event_queue = None
+    
+    def _drain_events(self) -> list:
+        """Pop up to EVENT_BATCH_SIZE queued events without waiting."""
+        batch = []
+        while len(batch) < self.EVENT_BATCH_SIZE:
+            try:
+                batch.append(self._event_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+    
+    async def _flush_events(self) -> None:
+        """
+        Background loop: write queued events every EVENT_FLUSH_INTERVAL
+        until stop_event_flusher signals, then once more to empty the queue.
+        """
+        stopping = False
+        while not stopping:
+            try:
+                await asyncio.wait_for(self._flusher_stop.wait(), self.EVENT_FLUSH_INTERVAL)
+                stopping = True
+            except asyncio.TimeoutError:
+                pass
+            while batch := self._drain_events():
+                await self._write_events(batch)
+    
+    async def _write_events(self, batch: list) -> bool:
+        """Insert a batch of events and bump each session's count once."""
+        if not Database.is_connected():
+            return False
+        
+        try:
+            collection = Database.get_collection(Database.ANALYTICS)
+            sessions = Database.get_collection(Database.SESSIONS)
+            
+            # One $inc per session instead of one per event, issued
+            # alongside the insert
+            counts = Counter(doc["session_id"] for doc in batch)
+            await asyncio.gather(
+                collection.insert_many(batch, ordered=False),
+                sessions.bulk_write(
+                    [UpdateOne({"_id": sid}, {"$inc": {"event_count": n}}) for sid, n in counts.items()],
+                    ordered=False
+                )
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} analytics events: {e}")
+            return False
+    
     async def track_event(
         self,
         session_id: str,
@@ -226,33 +457,29 @@ class StorageService:
         Track an analytics event.
         
         Event types: 'upload', 'analyze', 'download_report', 'mode_change', 'page_view'
+        
+        Events are queued and written in batches by the background flusher;
+        without a running flusher they are written immediately.
         """
         if not Database.is_connected():
             return False
         
+        event_doc = {
+            "_id": uuid.uuid4().hex,
+            "session_id": session_id,
+            "event_type": event_type,
+            "event_data": event_data or {},
+            "timestamp": datetime.now(timezone.utc)
+        }
+        
+        if self._event_queue is None:
+            return await self._write_events([event_doc])
+        
         try:
-            event_doc = {
-                "_id": str(uuid.uuid4()),
-                "session_id": session_id,
-                "event_type": event_type,
-                "event_data": event_data or {},
-                "timestamp": datetime.now(timezone.utc)
-            }
-            
-            collection = Database.get_collection(Database.ANALYTICS)
-            await collection.insert_one(event_doc)
-            
-            # Update session event count
-            sessions = Database.get_collection(Database.SESSIONS)
-            await sessions.update_one(
-                {"_id": session_id},
-                {"$inc": {"event_count": 1}}
-            )
-            
+            self._event_queue.put_nowait(event_doc)
             return True
-            
-        except Exception as e:
-            logger.error(f"Failed to track event: {e}")
+        except asyncio.QueueFull:
+            logger.warning("Analytics event queue full - dropping event")
             return False
     
     async def get_session_analytics(self, session_id: str) -> Optional[Dict[str, Any]]:
@@ -271,21 +498,33 @@ class StorageService:
             uploads = Database.get_collection(Database.UPLOADS)
             upload_count = await uploads.count_documents({"session_id": session_id})
             
-            # Get analysis results
-            results = Database.get_collection(Database.ANALYSIS_RESULTS)
+            # Classification breakdown, joined server-side in one round trip
+            # (uploads -> analysis_results, both sides indexed)
             pipeline = [
-                {"$match": {"upload_id": {"$in": [u["_id"] async for u in uploads.find({"session_id": session_id})]}}},
+                {"$match": {"session_id": session_id}},
+                {"$lookup": {
+                    "from": Database.ANALYSIS_RESULTS,
+                    "localField": "_id",
+                    "foreignField": "upload_id",
+                    "as": "results"
+                }},
+                {"$unwind": "$results"},
                 {"$group": {
-                    "_id": "$classification",
+                    "_id": "$results.classification",
                     "count": {"$sum": 1}
                 }}
             ]
+            classification_counts = {
+                row["_id"]: row["count"]
+                async for row in uploads.aggregate(pipeline)
+            }
             
             return {
                 "session_id": session_id,
                 "started_at": session["started_at"],
                 "upload_count": upload_count,
-                "event_count": session.get("event_count", 0)
+                "event_count": session.get("event_count", 0),
+                "classification_counts": classification_counts
             }
             
         except Exception as e:
@@ -304,7 +543,7 @@ class StorageService:
         Save biometric analysis data with compressed image to MongoDB.
         
         - Compresses image using zlib
-        - Stores as base64 in MongoDB
+        - Stores the compressed bytes as BSON Binary (no base64 inflation)
         - Saves full analysis result
         
         Returns: document ID or None
@@ -314,14 +553,13 @@ class StorageService:
             return None
         
         try:
-            doc_id = str(uuid.uuid4())
-            
-            # Compress image bytes with zlib
-            compressed = zlib.compress(image_bytes, level=6)
-            compressed_b64 = base64.b64encode(compressed).decode('utf-8')
+            doc_id = uuid.uuid4().hex
             
-            # Calculate hash for deduplication
-            image_hash = hashlib.sha256(image_bytes).hexdigest()
+            # Compress and hash in a worker thread so multi-MB images do not
+            # stall the event loop
+            compressed, image_hash = await asyncio.to_thread(
+                _pack_biometric_image, image_bytes
+            )
             
             # Create document
             biometric_doc = {
@@ -329,7 +567,7 @@ class StorageService:
                 "service_type": service_type,
                 "session_id": session_id,
                 "image_hash": image_hash,
-                "image_compressed_b64": compressed_b64,
+                "image_compressed": Binary(compressed),
                 "original_size_bytes": len(image_bytes),
                 "compressed_size_bytes": len(compressed),
                 "compression_ratio": round(len(image_bytes) / len(compressed), 2) if compressed else 1,
@@ -347,7 +585,11 @@ class StorageService:
             return doc_id
             
         except Exception as e:
-            logger.error(f"Failed to save biometric data: {e}")
+            # Usually runs as a background task, so this log is the only record of the drop
+            logger.error(
+                f"Failed to save biometric data ({service_type}, {filename}, "
+                f"{len(image_bytes)} bytes): {e}"
+            )
             return None
 
 
@@ -6,8 +6,9 @@ FastAPI application for detecting deepfake images, videos, and synthetic audio.
 """
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 import time
 
@@ -19,8 +20,11 @@ from app.services.audio_detector import audio_detector
 from app.services.fusion_engine import fusion_engine
 from app.services.advanced_analytics import advanced_analytics
 from app.services.nvidia_hive import nvidia_hive
+from app.services.face_recognition import face_recognition_service
+from app.services.age_estimator import age_estimator
 from app.models.response import HealthResponse
 from app.database.connection import Database
+from app.database.storage import storage_service
 
 # Configure logging
 logging.basicConfig(
@@ -52,6 +56,13 @@ async def lifespan(app: FastAPI):
     fusion_engine.initialize()
     logger.info(f"  Fusion Engine: ✓")
     
+    # Biometric models (DeepFace builds these lazily on first use otherwise)
+    face_loaded = await asyncio.to_thread(face_recognition_service.warmup)
+    logger.info(f"  Face Recognition: {'✓' if face_loaded else '✗ (DeepFace not available)'}")
+    
+    age_loaded = await asyncio.to_thread(age_estimator.warmup)
+    logger.info(f"  Age Estimator: {'✓' if age_loaded else '✗ (using fallback)'}")
+    
     # Advanced Analytics (HuggingFace)
     advanced_loaded = advanced_analytics.load()
     logger.info(f"  Advanced Analytics (HF): {'✓' if advanced_loaded else '✗ (HF_TOKEN not set)'}")
@@ -67,7 +78,10 @@ async def lifespan(app: FastAPI):
     # Connect to MongoDB
     db_connected = await Database.connect()
     logger.info(f"  MongoDB: {'✓ Connected' if db_connected else '✗ (Not available - running without storage)'}")
+    if db_connected:
+        storage_service.start_event_flusher()
     
+    app.state.ready = True
     logger.info("API Ready!")
     logger.info(f"Docs: http://localhost:{settings.API_PORT}/docs")
     logger.info("=" * 50)
@@ -75,6 +89,9 @@ async def lifespan(app: FastAPI):
     yield
     
     # Cleanup
+    app.state.ready = False
+    nvidia_hive.close()
+    await storage_service.stop_event_flusher()
     await Database.disconnect()
     logger.info("Shutting down Deepfake Detection API...")
 
@@ -103,7 +120,10 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Responses carry signal dicts, base64 forensic plots and embeddings;
+    # orjson encodes them several times faster than the stdlib encoder
+    default_response_class=ORJSONResponse
 )
 
 # CORS Configuration
@@ -182,6 +202,15 @@ async def health_check():
     )
 
 
+# Readiness probe
+@app.get("/ready", tags=["General"])
+async def readiness_check(request: Request):
+    """Report 503 until startup has finished loading every model."""
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+
 # Include API routes
 app.include_router(routes.router, prefix="/api/v1/analyze")
 
@@ -1,6 +1,7 @@
 """Enhanced Detection Service - Advanced Deep Learning Models (Dual-Model Ensemble)."""
 import os
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Union
 import logging
 
 logger = logging.getLogger(__name__)
@@ -82,8 +83,13 @@ class AdvancedAnalyticsService:
         
         return fake_prob, real_prob
     
-    def analyze_image(self, image_path: str) -> Dict[str, Any]:
-        """Analyze image using DUAL model ensemble for maximum accuracy."""
+    def analyze_image(self, image: Union[str, bytes]) -> Dict[str, Any]:
+        """
+        Analyze image using DUAL model ensemble for maximum accuracy.
+        
+        Args:
+            image: Path to an image file, or the raw encoded image bytes
+        """
         if not self._available:
             return {'error': 'Enhanced detection unavailable', 'available': False}
         
@@ -94,7 +100,7 @@ class AdvancedAnalyticsService:
         
         # Run Model V2
         try:
-            output_v2 = self.client.image_classification(image_path, model=self._IMAGE_MODEL_V2)
+            output_v2 = self.client.image_classification(image, model=self._IMAGE_MODEL_V2)
             v2_fake, v2_real = self._parse_v2_output(output_v2)
             v2_result = output_v2
             logger.info(f"V2 Model: fake={v2_fake:.3f}, real={v2_real:.3f}")
@@ -103,7 +109,7 @@ class AdvancedAnalyticsService:
         
         # Run Model V3 (SigLIP-based)
         try:
-            output_v3 = self.client.image_classification(image_path, model=self._IMAGE_MODEL_V3)
+            output_v3 = self.client.image_classification(image, model=self._IMAGE_MODEL_V3)
             v3_fake, v3_real = self._parse_v3_output(output_v3)
             v3_result = output_v3
             logger.info(f"V3 Model: fake={v3_fake:.3f}, real={v3_real:.3f}")
@@ -162,6 +168,24 @@ class AdvancedAnalyticsService:
             'confidence': confidence
         }
     
+    def analyze_images_batch(self, images: List[Union[str, bytes]]) -> List[Dict[str, Any]]:
+        """
+        Analyze several images at once (e.g. sampled video frames).
+        
+        The Inference API takes one image per request, so the requests are
+        issued concurrently and the total latency is roughly one round trip.
+        
+        Returns:
+            One result dict per input, in input order
+        """
+        if not self._available:
+            return [{'error': 'Enhanced detection unavailable', 'available': False} for _ in images]
+        if not images:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=len(images)) as pool:
+            return list(pool.map(self.analyze_image, images))
+    
     def analyze_audio(self, audio_path: str) -> Dict[str, Any]:
         """Audio analysis uses local models only."""
         return {
@@ -13,6 +13,10 @@ import cv2
 import numpy as np
 from typing import Dict, Any, Optional
 
+from app.services import deepface_onnx
+from app.services.image_stats import mean_local_variance
+from app.services.onnx_runtime import load_session
+
 logger = logging.getLogger(__name__)
 
 # Flag to track if DeepFace is available
@@ -37,7 +41,12 @@ class AgeEstimator:
     
     def __init__(self):
         self._loaded = True
-        if DEEPFACE_AVAILABLE:
+        self._model = None
+        # Exported ONNX graph of the DeepFace Age model, when deployed
+        self._session = load_session(deepface_onnx.onnx_filename("Age"))
+        if self._session is not None:
+            logger.info("✓ Age Estimator initialized with ONNX Runtime")
+        elif DEEPFACE_AVAILABLE:
             logger.info("✓ Age Estimator initialized with DeepFace models")
         else:
             logger.info("✓ Age Estimator initialized with fallback CV methods")
@@ -46,35 +55,70 @@ class AgeEstimator:
         """Check if service is available."""
         return self._loaded
     
-    def estimate(self, image: np.ndarray) -> Dict[str, Any]:
+    def warmup(self) -> bool:
+        """
+        Build the DeepFace age model up front.
+        
+        DeepFace otherwise constructs (and may download) the model on the
+        first analyze call, stalling the first request.
+        """
+        if self._session is not None:
+            # The exported ONNX graph is already loaded; Keras is not used
+            return True
+        
+        if not DEEPFACE_AVAILABLE:
+            return False
+        
+        if self._model is not None:
+            return True
+        
+        try:
+            # Keep the built model referenced for the process lifetime so
+            # analyze() always resolves to this instance
+            try:
+                self._model = DeepFace.build_model("Age", task="facial_attribute")
+            except TypeError:
+                # Older deepface releases take no task argument
+                self._model = DeepFace.build_model("Age")
+            logger.info("✓ DeepFace age model loaded")
+            return True
+        except Exception as e:
+            logger.warning(f"Age model warmup failed: {e}")
+            return False
+    
+    def estimate(self, image: np.ndarray, is_bgr: bool = False) -> Dict[str, Any]:
         """
         Estimate age from facial image using DeepFace pretrained model.
         
         Args:
             image: RGB face image as numpy array
+            is_bgr: The image is already BGR (e.g. straight from cv2.imdecode),
+                so the channel swap is skipped
             
         Returns:
             Age estimation with confidence interval
         """
+        # Every path below works in BGR; convert once up front
+        img_bgr = image
         try:
-            if DEEPFACE_AVAILABLE:
-                return self._estimate_with_deepface(image)
+            img_bgr = deepface_onnx.as_bgr(image, is_bgr)
+            if self._session is not None:
+                return self._estimate_with_onnx(img_bgr)
+            elif DEEPFACE_AVAILABLE:
+                return self._estimate_with_deepface(img_bgr)
             else:
-                return self._estimate_fallback(image)
+                return self._estimate_fallback(img_bgr)
                 
         except Exception as e:
             logger.error(f"Age estimation failed: {e}")
-            return self._estimate_fallback(image)
+            return self._estimate_fallback(img_bgr)
     
-    def _estimate_with_deepface(self, image: np.ndarray) -> Dict[str, Any]:
+    def _estimate_with_deepface(self, img_bgr: np.ndarray) -> Dict[str, Any]:
         """Use DeepFace pretrained model for age estimation."""
+        if self._model is None:
+            self.warmup()
+        
         try:
-            # DeepFace expects BGR format, convert if RGB
-            if len(image.shape) == 3 and image.shape[2] == 3:
-                img_bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-            else:
-                img_bgr = image
-            
             # Analyze with DeepFace - uses pretrained age model
             result = DeepFace.analyze(
                 img_bgr, 
@@ -88,49 +132,64 @@ class AgeEstimator:
                 result = result[0]
             
             estimated_age = float(result.get('age', 30))
+            return self._pretrained_result(estimated_age, "DeepFace-Age")
             
-            # Generate distribution
-            uncertainty = 4.0  # DeepFace is more accurate, ±4 years
-            distribution = self._generate_age_distribution(estimated_age, uncertainty)
-            
-            # Calculate confidence interval (95%)
-            lower_bound = max(0, estimated_age - 2 * uncertainty)
-            upper_bound = min(100, estimated_age + 2 * uncertainty)
-            
-            # Determine age group
-            age_group = self._get_age_group(estimated_age)
+        except Exception as e:
+            logger.warning(f"DeepFace estimation failed, using fallback: {e}")
+            return self._estimate_fallback(img_bgr)
+    
+    def _estimate_with_onnx(self, img_bgr: np.ndarray) -> Dict[str, Any]:
+        """Run the exported DeepFace Age model through ONNX Runtime."""
+        try:
+            batch = deepface_onnx.preprocess_face(img_bgr, deepface_onnx.input_size(self._session))
+            probs = deepface_onnx.run(self._session, batch)[0]
             
-            return {
-                "estimated_age": round(estimated_age, 1),
-                "confidence_interval_95": {
-                    "lower_bound": round(lower_bound, 1),
-                    "upper_bound": round(upper_bound, 1)
-                },
-                "age_group": age_group,
-                "uncertainty_years": uncertainty,
-                "age_distribution": distribution,
-                "model": "DeepFace-Age",
-                "method": "pretrained_cnn"
-            }
+            # Apparent age is the expectation over the 101 age classes,
+            # as in DeepFace's own Age model
+            estimated_age = float(np.dot(probs, np.arange(probs.shape[0])))
+            return self._pretrained_result(estimated_age, "DeepFace-Age-ONNX")
             
         except Exception as e:
-            logger.warning(f"DeepFace estimation failed, using fallback: {e}")
-            return self._estimate_fallback(image)
+            logger.warning(f"ONNX age estimation failed, using fallback: {e}")
+            return self._estimate_fallback(img_bgr)
+    
+    def _pretrained_result(self, estimated_age: float, model: str) -> Dict[str, Any]:
+        """Build the estimate response for a pretrained model's age prediction."""
+        # Generate distribution
+        uncertainty = 4.0  # DeepFace is more accurate, ±4 years
+        distribution = self._generate_age_distribution(estimated_age, uncertainty)
+        
+        # Calculate confidence interval (95%)
+        lower_bound = max(0, estimated_age - 2 * uncertainty)
+        upper_bound = min(100, estimated_age + 2 * uncertainty)
+        
+        # Determine age group
+        age_group = self._get_age_group(estimated_age)
+        
+        return {
+            "estimated_age": round(estimated_age, 1),
+            "confidence_interval_95": {
+                "lower_bound": round(lower_bound, 1),
+                "upper_bound": round(upper_bound, 1)
+            },
+            "age_group": age_group,
+            "uncertainty_years": uncertainty,
+            "age_distribution": distribution,
+            "model": model,
+            "method": "pretrained_cnn"
+        }
     
-    def _estimate_fallback(self, image: np.ndarray) -> Dict[str, Any]:
+    def _estimate_fallback(self, img_bgr: np.ndarray) -> Dict[str, Any]:
         """Fallback estimation using CV techniques."""
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
             
             # Simple texture analysis
             edges = cv2.Canny(cv2.GaussianBlur(gray, (3, 3), 0), 50, 150)
-            edge_density = np.sum(edges > 0) / edges.size
+            edge_density = cv2.countNonZero(edges) / edges.size
             
-            # Variance analysis
-            kernel_size = 5
-            mean = cv2.blur(gray.astype(float), (kernel_size, kernel_size))
-            sqr_mean = cv2.blur(gray.astype(float)**2, (kernel_size, kernel_size))
-            variance = float(np.mean(sqr_mean - mean**2))
+            # Variance analysis: mean local (5x5) variance
+            variance = mean_local_variance(gray, 5)
             
             # Estimate age (rough approximation)
             base_age = 25.0
@@ -164,15 +223,15 @@ class AgeEstimator:
     
     def _generate_age_distribution(self, estimated_age: float, uncertainty: float) -> Dict[int, float]:
         """Generate probability distribution around estimated age."""
-        distribution = {}
-        for age in range(max(0, int(estimated_age - 15)), min(100, int(estimated_age + 15))):
-            prob = np.exp(-0.5 * ((age - estimated_age) / uncertainty) ** 2)
-            distribution[age] = round(prob, 4)
+        ages = np.arange(max(0, int(estimated_age - 15)), min(100, int(estimated_age + 15)))
+        
+        # One vectorized Gaussian over the whole age window
+        probs = np.round(np.exp(-0.5 * ((ages - estimated_age) / uncertainty) ** 2), 4)
         
-        total = sum(distribution.values())
+        total = probs.sum()
         if total > 0:
-            distribution = {k: round(v / total, 4) for k, v in distribution.items()}
-        return distribution
+            probs = np.round(probs / total, 4)
+        return dict(zip(ages.tolist(), probs.tolist()))
     
     def _get_age_group(self, age: float) -> str:
         """Determine age group from estimated age."""
@@ -1,7 +1,7 @@
 """Audio Detector Service for voice synthesis detection."""
 import numpy as np
 import onnxruntime as ort
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union, BinaryIO
 import logging
 from pathlib import Path
 
@@ -13,6 +13,10 @@ logger = logging.getLogger(__name__)
 class AudioDetectorService:
     """Service for audio deepfake/voice synthesis detection."""
     
+    # Formats soundfile can decode straight from a file object; anything
+    # else goes through audioread, which needs a real path on disk.
+    FILE_OBJECT_FORMATS = ('.wav', '.flac', '.ogg')
+    
     def __init__(self):
         self.session: Optional[ort.InferenceSession] = None
         self._loaded = False
@@ -53,8 +57,8 @@ class AudioDetectorService:
         """Check if model is loaded."""
         return self._loaded
     
-    def load_audio(self, audio_path: str) -> Optional[np.ndarray]:
-        """Load and preprocess audio file."""
+    def load_audio(self, audio_path: Union[str, BinaryIO]) -> Optional[np.ndarray]:
+        """Load and preprocess audio from a path or an open file object."""
         try:
             import librosa
             audio, sr = librosa.load(audio_path, sr=self.sample_rate)
@@ -124,8 +128,8 @@ class AudioDetectorService:
                 'spectral_centroid': 0.0
             }
     
-    def analyze(self, audio_path: str) -> Dict[str, Any]:
-        """Analyze audio file for synthetic voice detection."""
+    def analyze(self, audio_path: Union[str, BinaryIO]) -> Dict[str, Any]:
+        """Analyze audio (path or file object) for synthetic voice detection."""
         result = {
             'prediction': None,
             'audio_features': {}
@@ -183,15 +187,12 @@ class AudioDetectorService:
         # Get file extension
         ext = os.path.splitext(filename)[1] or '.wav'
         
-        # Write to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            tmp.write(audio_bytes)
-            tmp_path = tmp.name
-        
-        try:
+        # Write to a temp directory that is removed with everything in it
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = os.path.join(tmp_dir, "upload" + ext)
+            with open(tmp_path, 'wb') as f:
+                f.write(audio_bytes)
             result = self.analyze(tmp_path)
-        finally:
-            os.unlink(tmp_path)
         
         return result
 
@@ -0,0 +1,129 @@
+"""
+ONNX Runtime inference for DeepFace models exported by
+scripts/export_deepface_onnx.py
+
+Runs the exported Age and face recognition graphs directly, replacing the
+Keras forward pass inside DeepFace.analyze / DeepFace.represent.
+
+Face detection and eye alignment follow the procedure of DeepFace's
+'opencv' backend, but are a reimplementation rather than DeepFace's own
+code, whose crops also vary between DeepFace releases. Embeddings and
+ages on this path can therefore differ slightly from the Keras path, and
+DeepFace's verification thresholds have not been re-validated on it.
+"""
+import logging
+import cv2
+import numpy as np
+import onnxruntime as ort
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+# Same frontal-face and eye cascades DeepFace's 'opencv' detector backend uses
+_FACE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+_EYE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_eye.xml'
+_face_cascade = None
+_eye_cascade = None
+
+
+def onnx_filename(model_name: str) -> str:
+    """File name an exported DeepFace model is stored under in MODELS_DIR."""
+    return "deepface_" + model_name.lower().replace('-', '_') + ".onnx"
+
+
+def input_size(session: ort.InferenceSession) -> Tuple[int, int]:
+    """(height, width) of an NHWC model input, defaulting to 224x224."""
+    shape = session.get_inputs()[0].shape
+    h, w = shape[1], shape[2]
+    return (h if isinstance(h, int) else 224, w if isinstance(w, int) else 224)
+
+
+def as_bgr(image: np.ndarray, is_bgr: bool = False) -> np.ndarray:
+    """Three-channel BGR view of an RGB, BGR or grayscale image (no-op for BGR)."""
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if is_bgr:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+
+def _largest_face(img_bgr: np.ndarray) -> np.ndarray:
+    """Crop of the largest detected face, or the whole image if none is found."""
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(_FACE_CASCADE_PATH)
+
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    faces = _face_cascade.detectMultiScale(gray, 1.1, 10)
+    if len(faces) == 0:
+        return img_bgr
+
+    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    return img_bgr[y:y + h, x:x + w]
+
+
+def _align_eyes(face_bgr: np.ndarray) -> np.ndarray:
+    """
+    Rotate a face crop so its eyes are level, as DeepFace's default
+    align=True does for the opencv backend.
+    
+    The two largest eye-cascade detections in the crop are taken as the
+    eyes; with fewer than two the crop is returned unaligned, as DeepFace
+    does.
+    """
+    global _eye_cascade
+    if _eye_cascade is None:
+        _eye_cascade = cv2.CascadeClassifier(_EYE_CASCADE_PATH)
+
+    gray = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2GRAY)
+    eyes = sorted(_eye_cascade.detectMultiScale(gray, 1.1, 10), key=lambda e: e[2] * e[3], reverse=True)
+    if len(eyes) < 2:
+        return face_bgr
+
+    # Eye centres, left to right in the image
+    (lx, ly), (rx, ry) = sorted((ex + ew / 2, ey + eh / 2) for ex, ey, ew, eh in eyes[:2])
+    angle = float(np.degrees(np.arctan2(ry - ly, rx - lx)))
+    if angle == 0.0:
+        return face_bgr
+
+    h, w = face_bgr.shape[:2]
+    rotation = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+    return cv2.warpAffine(
+        face_bgr, rotation, (w, h),
+        flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0)
+    )
+
+
+def preprocess_face(img_bgr: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Detect, crop, eye-align and letterbox a face following DeepFace's
+    opencv-backend preprocessing (see the module note on how closely).
+
+    Returns a float32 NHWC batch of one, scaled to [0, 1].
+    """
+    face = _largest_face(img_bgr)
+    if face is not img_bgr:
+        face = _align_eyes(face)
+    target_h, target_w = size
+
+    # Resize keeping aspect ratio, then pad to the model input size
+    factor = min(target_h / face.shape[0], target_w / face.shape[1])
+    resized = cv2.resize(
+        face,
+        (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor)))
+    )
+    pad_h = target_h - resized.shape[0]
+    pad_w = target_w - resized.shape[1]
+    padded = cv2.copyMakeBorder(
+        resized,
+        pad_h // 2, pad_h - pad_h // 2,
+        pad_w // 2, pad_w - pad_w // 2,
+        cv2.BORDER_CONSTANT, value=0
+    )
+
+    return (padded.astype(np.float32) / 255.0)[np.newaxis]
+
+
+def run(session: ort.InferenceSession, batch: np.ndarray) -> np.ndarray:
+    """Run a single-input, single-output session and return its output."""
+    return session.run(None, {session.get_inputs()[0].name: batch})[0]
@@ -8,11 +8,18 @@ This service provides:
 - Multiple backend support (VGG-Face, Facenet, ArcFace)
 """
 
+import hashlib
 import logging
+import threading
 import cv2
 import numpy as np
+from collections import OrderedDict
 from typing import Dict, Any, Optional, List, Tuple
 
+from app.config import settings
+from app.services import deepface_onnx
+from app.services.onnx_runtime import load_session
+
 logger = logging.getLogger(__name__)
 
 # Check for DeepFace
@@ -25,6 +32,45 @@ except ImportError:
     logger.warning("DeepFace not installed. Face recognition will be limited.")
 
 
+# DeepFace's cosine distance thresholds, used when its own lookup is missing.
+# They are tuned on DeepFace's own aligned crops; on the ONNX path
+# (deepface_onnx.preprocess_face) they have not been re-validated
+_COSINE_THRESHOLDS = {
+    "VGG-Face": 0.68,
+    "Facenet": 0.40,
+    "Facenet512": 0.30,
+    "ArcFace": 0.68,
+}
+
+
+def _cosine_threshold(model_name: str) -> Optional[float]:
+    """DeepFace's verification threshold for `model_name` on cosine distance."""
+    try:
+        from deepface.modules.verification import find_threshold
+    except ImportError:
+        try:
+            from deepface.commons.distance import findThreshold as find_threshold
+        except ImportError:
+            return _COSINE_THRESHOLDS.get(model_name)
+    try:
+        return float(find_threshold(model_name, "cosine"))
+    except Exception:
+        return _COSINE_THRESHOLDS.get(model_name)
+
+
+def _embedding_key(img: np.ndarray) -> bytes:
+    """Embedding cache key: digest of the exact pixels and their shape."""
+    digest = hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16)
+    digest.update(str(img.shape).encode())
+    return digest.digest()
+
+
+def _l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Scale embeddings (a vector or rows of a matrix) to unit length."""
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
 class FaceRecognitionService:
     """
     Face Recognition using DeepFace pretrained models.
@@ -37,9 +83,20 @@ class FaceRecognitionService:
     
     def __init__(self, model_name: str = "VGG-Face"):
         self._model_name = model_name
-        self._loaded = DEEPFACE_AVAILABLE
+        self._model = None
+        self._haar = None  # OpenCV fallback detector, parsed on first use
+        # LRU of embeddings by image content, so a reference face matched
+        # against many candidates only goes through the CNN once
+        self._emb_cache: "OrderedDict[bytes, Optional[np.ndarray]]" = OrderedDict()
+        self._emb_cache_lock = threading.Lock()
+        self._distance_threshold = _cosine_threshold(model_name)
+        # Exported ONNX graph of the recognition model, when deployed
+        self._session = load_session(deepface_onnx.onnx_filename(model_name))
+        self._loaded = DEEPFACE_AVAILABLE or self._session is not None
         
-        if DEEPFACE_AVAILABLE:
+        if self._session is not None:
+            logger.info(f"✓ Face Recognition initialized with {model_name} (ONNX Runtime)")
+        elif DEEPFACE_AVAILABLE:
             logger.info(f"✓ Face Recognition initialized with {model_name}")
         else:
             logger.warning("Face Recognition unavailable - install deepface: pip install deepface")
@@ -48,11 +105,36 @@ class FaceRecognitionService:
         """Check if service is available."""
         return self._loaded
     
+    def warmup(self) -> bool:
+        """
+        Build the recognition model up front.
+        
+        DeepFace otherwise constructs (and may download) the model on the
+        first verify/represent call, stalling the first request.
+        """
+        if self._session is not None:
+            # The exported ONNX graph is already loaded; Keras is not used
+            return True
+        
+        if not DEEPFACE_AVAILABLE:
+            return False
+        
+        try:
+            # Held for the process lifetime; represent() resolves to this
+            # same cached instance instead of constructing a new one
+            self._model = DeepFace.build_model(self._model_name)
+            logger.info(f"✓ Face Recognition model {self._model_name} loaded")
+            return True
+        except Exception as e:
+            logger.warning(f"Face Recognition warmup failed: {e}")
+            return False
+    
     def match_faces(
         self, 
         image1: np.ndarray, 
         image2: np.ndarray,
-        threshold: float = 0.6
+        threshold: float = 0.6,
+        is_bgr: bool = False
     ) -> Dict[str, Any]:
         """
         Compare two face images and determine if they belong to the same person.
@@ -61,53 +143,97 @@ class FaceRecognitionService:
             image1: First face image (RGB numpy array)
             image2: Second face image (RGB numpy array)
             threshold: Similarity threshold (0-1), higher = stricter
+            is_bgr: Images are already BGR, so the channel swap is skipped
             
         Returns:
             Match result with similarity score
         """
+        return self.match_faces_batch(image1, [image2], threshold, is_bgr)[0]
+    
+    def match_faces_batch(
+        self,
+        probe: np.ndarray,
+        gallery: List[np.ndarray],
+        threshold: float = 0.6,
+        is_bgr: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Compare one probe face against each gallery face (1:N matching).
+        
+        The probe is embedded once and all gallery faces go through the
+        recognition model together, then every similarity comes out of one
+        matrix-vector product.
+        
+        Args:
+            probe: Probe face image (RGB numpy array)
+            gallery: Gallery face images (RGB numpy arrays)
+            threshold: Similarity threshold (0-1), higher = stricter
+            is_bgr: Images are already BGR, so the channel swap is skipped
+            
+        Returns:
+            One match result per gallery image, in order (image1 is the
+            probe, image2 the gallery face)
+        """
         if not self._loaded:
-            return {
+            return [{
                 "match": False,
                 "similarity_score": 0.0,
                 "verified": False,
                 "error": "DeepFace not installed. Run: pip install deepface",
                 "model": "unavailable"
-            }
+            } for _ in gallery]
         
         try:
-            # Convert to BGR for DeepFace
-            img1_bgr = cv2.cvtColor(image1, cv2.COLOR_RGB2BGR)
-            img2_bgr = cv2.cvtColor(image2, cv2.COLOR_RGB2BGR)
-            
-            # Use DeepFace verify function
-            result = DeepFace.verify(
-                img1_bgr,
-                img2_bgr,
-                model_name=self._model_name,
-                enforce_detection=False,
-                detector_backend='opencv'
+            # Embed all faces here rather than via DeepFace.verify, which
+            # re-resolves the model and detector and recomputes both
+            # representations for every pair
+            embeddings = self._represent_batch(
+                [deepface_onnx.as_bgr(img, is_bgr) for img in (probe, *gallery)]
             )
+            probe_emb, gallery_embs = embeddings[0], embeddings[1:]
             
-            verified = result.get('verified', False)
-            distance = result.get('distance', 1.0)
+            if probe_emb is None:
+                return [self._no_face_result() for _ in gallery]
             
-            # Convert distance to similarity (inverse relationship)
-            # Distance of 0 = perfect match, higher = less similar
-            similarity = max(0, 1 - distance)
+            found = [k for k, emb in enumerate(gallery_embs) if emb is not None]
+            results = [self._no_face_result() for _ in gallery]
+            if not found:
+                return results
             
-            return {
-                "match": verified,
-                "similarity_score": round(similarity, 4),
-                "distance": round(distance, 4),
-                "threshold": result.get('threshold', threshold),
-                "verified": verified,
-                "model": self._model_name,
-                "detector": result.get('detector_backend', 'opencv'),
-                "faces_detected": {
-                    "image1": True,
-                    "image2": True
+            # On L2-normalized embeddings cosine similarity is a plain dot
+            # product, and normalized gallery rows can be reused as-is
+            stacked = _l2_normalize(np.stack([gallery_embs[k] for k in found]))
+            similarities = stacked @ _l2_normalize(probe_emb)
+            
+            # DeepFace's tuned cosine threshold for this model when known,
+            # otherwise the caller's similarity threshold
+            distance_threshold = (
+                self._distance_threshold if self._distance_threshold is not None
+                else 1.0 - threshold
+            )
+            
+            for k, cosine in zip(found, similarities):
+                distance = 1.0 - float(cosine)
+                verified = distance <= distance_threshold
+                
+                # Convert distance to similarity (inverse relationship)
+                # Distance of 0 = perfect match, higher = less similar
+                similarity = max(0, 1 - distance)
+                
+                results[k] = {
+                    "match": verified,
+                    "similarity_score": round(similarity, 4),
+                    "distance": round(distance, 4),
+                    "threshold": distance_threshold,
+                    "verified": verified,
+                    "model": self._model_name,
+                    "detector": 'opencv',
+                    "faces_detected": {
+                        "image1": True,
+                        "image2": True
+                    }
                 }
-            }
+            return results
             
         except Exception as e:
             error_msg = str(e)
@@ -115,39 +241,102 @@ class FaceRecognitionService:
             
             # Check if it's a face detection error
             if "face" in error_msg.lower() and "detect" in error_msg.lower():
-                return {
-                    "match": False,
-                    "similarity_score": 0.0,
-                    "verified": False,
-                    "error": "Could not detect face in one or both images",
-                    "model": self._model_name
-                }
+                return [self._no_face_result() for _ in gallery]
             
-            return {
+            return [{
                 "match": False,
                 "similarity_score": 0.0,
                 "verified": False,
                 "error": error_msg,
                 "model": self._model_name
-            }
+            } for _ in gallery]
+    
+    def _no_face_result(self) -> Dict[str, Any]:
+        return {
+            "match": False,
+            "similarity_score": 0.0,
+            "verified": False,
+            "error": "Could not detect face in one or both images",
+            "model": self._model_name
+        }
     
-    def detect_faces(self, image: np.ndarray) -> Dict[str, Any]:
+    def _represent(self, img_bgr: np.ndarray) -> Optional[np.ndarray]:
+        """Embedding of the first detected face (whole image if none), or None."""
+        return self._represent_batch([img_bgr])[0]
+    
+    def _represent_batch(self, images_bgr: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """
+        _represent for several images; the ONNX path runs them as one batch.
+        
+        Images already embedded recently are served from the embedding cache
+        and only the misses reach the model.
+        """
+        keys = [_embedding_key(img) for img in images_bgr]
+        results: List[Optional[np.ndarray]] = [None] * len(images_bgr)
+        missing = []
+        
+        with self._emb_cache_lock:
+            for k, key in enumerate(keys):
+                if key in self._emb_cache:
+                    self._emb_cache.move_to_end(key)
+                    results[k] = self._emb_cache[key]
+                else:
+                    missing.append(k)
+        
+        if missing:
+            computed = self._embed_uncached([images_bgr[k] for k in missing])
+            with self._emb_cache_lock:
+                for k, emb in zip(missing, computed):
+                    if emb is not None:
+                        emb.setflags(write=False)  # shared with later hits
+                    results[k] = emb
+                    if settings.FACE_EMBEDDING_CACHE_SIZE > 0:
+                        self._emb_cache[keys[k]] = emb
+                while len(self._emb_cache) > settings.FACE_EMBEDDING_CACHE_SIZE:
+                    self._emb_cache.popitem(last=False)
+        
+        return results
+    
+    def _embed_uncached(self, images_bgr: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """Run the recognition model on each image."""
+        if self._session is not None:
+            size = deepface_onnx.input_size(self._session)
+            batch = np.concatenate([deepface_onnx.preprocess_face(img, size) for img in images_bgr])
+            return list(deepface_onnx.run(self._session, batch).astype(np.float32))
+        
+        results = []
+        for img_bgr in images_bgr:
+            embeddings = DeepFace.represent(
+                img_bgr,
+                model_name=self._model_name,
+                enforce_detection=False,
+                detector_backend='opencv'
+            )
+            if not embeddings or not embeddings[0].get('embedding'):
+                results.append(None)
+            else:
+                results.append(np.asarray(embeddings[0]['embedding'], dtype=np.float32))
+        return results
+    
+    def detect_faces(self, image: np.ndarray, is_bgr: bool = False) -> Dict[str, Any]:
         """
         Detect faces in an image.
         
         Args:
             image: RGB image as numpy array
+            is_bgr: The image is already BGR, so the channel swap is skipped
             
         Returns:
             Detection result with face count and locations
         """
-        if not self._loaded:
+        if not DEEPFACE_AVAILABLE:
             # Fallback to OpenCV Haar Cascade
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            face_cascade = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY if is_bgr else cv2.COLOR_RGB2GRAY)
+            if self._haar is None:
+                self._haar = cv2.CascadeClassifier(
+                    cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+                )
+            faces = self._haar.detectMultiScale(gray, 1.1, 4)
             
             return {
                 "count": len(faces),
@@ -157,7 +346,7 @@ class FaceRecognitionService:
             }
         
         try:
-            img_bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            img_bgr = deepface_onnx.as_bgr(image, is_bgr)
             
             faces = DeepFace.extract_faces(
                 img_bgr,
@@ -192,12 +381,13 @@ class FaceRecognitionService:
                 "model": "error"
             }
     
-    def get_embedding(self, image: np.ndarray) -> Dict[str, Any]:
+    def get_embedding(self, image: np.ndarray, is_bgr: bool = False) -> Dict[str, Any]:
         """
         Extract face embedding vector for advanced use cases.
         
         Args:
             image: RGB face image
+            is_bgr: The image is already BGR, so the channel swap is skipped
             
         Returns:
             512-dimensional embedding vector
@@ -210,17 +400,12 @@ class FaceRecognitionService:
             }
         
         try:
-            img_bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            img_bgr = deepface_onnx.as_bgr(image, is_bgr)
             
-            embeddings = DeepFace.represent(
-                img_bgr,
-                model_name=self._model_name,
-                enforce_detection=False,
-                detector_backend='opencv'
-            )
+            embedding = self._represent(img_bgr)
             
-            if embeddings and len(embeddings) > 0:
-                embedding = embeddings[0].get('embedding', [])
+            if embedding is not None:
+                embedding = embedding.tolist()
                 return {
                     "embedding": embedding,
                     "dimension": len(embedding),
@@ -8,10 +8,206 @@ import os
 import joblib
 import logging
 import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from scipy import fft as sp_fft
 from app.config import settings
+from app.services.onnx_runtime import execution_providers, file_version, model_path
 
 logger = logging.getLogger(__name__)
 
+# Plots are only previews; quality 75 without Huffman optimisation keeps the
+# encode fast and the base64 payload small
+_PLOT_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 75, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+
+# Shared across requests for the plot branches of analyze()
+_plot_pool = ThreadPoolExecutor(
+    max_workers=min(4, os.cpu_count() or 1),
+    thread_name_prefix="forensic-plots"
+)
+
+# cv2.CLAHE keeps scratch buffers on the object, so it is not safe to share
+# across the plot pool's threads; build one per thread, once
+_thread_state = threading.local()
+
+
+def _clahe():
+    clahe = getattr(_thread_state, "clahe", None)
+    if clahe is None:
+        clahe = _thread_state.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe
+
+
+def _plot_b64(img: np.ndarray) -> str:
+    """
+    Base64 of the plot JPEG, as embedded in the JSON response.
+
+    The encoded buffer goes to b64encode without a copy, and base64 output is
+    pure ASCII, so the cheaper ASCII decode suffices.
+    """
+    _, buf = cv2.imencode('.jpg', img, _PLOT_JPEG_PARAMS)
+    return base64.b64encode(buf.data).decode('ascii')
+
+
+# Frames per batched rFFT in analyze_batch; bounds the complex128 spectra
+# held at once (about 7MB per 720p frame)
+_FFT_BATCH = 8
+
+MODEL_NAME = "forensic_classifier.onnx"
+SOFTMAX_MODEL_NAME = "forensic_classifier_sm.onnx"
+
+
+def _log_magnitude_half(img_gray: np.ndarray) -> np.ndarray:
+    """
+    20*log(|rFFT| + 1e-8) of a real image, computed in place over the half
+    spectrum. An (N, H, W) stack is transformed as one batched rFFT.
+    """
+    spec = sp_fft.rfft2(img_gray, axes=(-2, -1), workers=-1)
+    # abs writes into a buffer allocated once; the rest runs in place on it.
+    # The epsilon (not log1p) is what the classifier was trained with.
+    mag = np.empty(spec.shape, dtype=np.float64)
+    np.abs(spec, out=mag)
+    mag += 1e-8
+    np.log(mag, out=mag)
+    mag *= 20
+    return mag
+
+
+def _log_magnitude_spectrum(img_gray: np.ndarray) -> np.ndarray:
+    """
+    Centered log-magnitude spectrum, 20*log1p(|DFT|), for display.
+
+    Uses cv2.dft in float32 on the image zero-padded to an optimal DFT size
+    (sizes factorable by 2, 3 and 5), which OpenCV transforms much faster
+    than arbitrary sizes. The padding slightly changes the spectrum, so this
+    is only for the plot; classifier features come from _psd_features.
+    log1p needs no epsilon and keeps near-zero bins at 0 instead of -368 dB,
+    which the min-max normalisation of the plot would otherwise stretch over.
+    """
+    h, w = img_gray.shape
+    padded = cv2.copyMakeBorder(
+        img_gray, 0, cv2.getOptimalDFTSize(h) - h, 0, cv2.getOptimalDFTSize(w) - w,
+        cv2.BORDER_CONSTANT, value=0
+    )
+    dft = cv2.dft(np.float32(padded), flags=cv2.DFT_COMPLEX_OUTPUT)
+    mag = cv2.magnitude(dft[..., 0], dft[..., 1])
+    np.log1p(mag, out=mag)
+    mag *= 20
+    return np.fft.fftshift(mag)
+
+
+def _radial_bins(shape, center):
+    """Integer radius of each pixel (flattened) about `center`, with per-bin counts."""
+    y, x = np.indices(shape)
+    r_int = np.hypot(x - center[0], y - center[1]).astype(np.intp).ravel()
+    counts = np.bincount(r_int)
+    return r_int, counts, counts > 0
+
+
+@lru_cache(maxsize=8)
+def _radial_index(shape):
+    """_radial_bins about the image center, cached per shape (read-only arrays)."""
+    h, w = shape
+    bins = _radial_bins(shape, ((w - 1) / 2.0, (h - 1) / 2.0))
+    for arr in bins:
+        arr.setflags(write=False)
+    return bins
+
+
+@lru_cache(maxsize=8)
+def _half_spectrum_index(shape):
+    """
+    Radius bins of the centered full spectrum, addressed from the rfft2 half.
+
+    Returns (direct, mirror, m, counts, present): `direct` is the bin of every
+    half-spectrum element, `mirror` the bin of the conjugate-symmetric twin of
+    half columns 1..m, which fill the columns rfft2 leaves out. Cached per
+    image shape, read-only.
+    """
+    h, w = shape
+    hw = w // 2 + 1
+    m = w - hw
+
+    r_int, counts, present = _radial_index(shape)
+    # Bins in unshifted FFT order, so the spectrum itself is never shifted
+    r_unshifted = np.fft.ifftshift(r_int.reshape(shape))
+
+    direct = np.ascontiguousarray(r_unshifted[:, :hw]).ravel()
+    rows = (-np.arange(h)) % h
+    mirror = r_unshifted[rows[:, None], w - np.arange(1, m + 1)].ravel()
+
+    for arr in (direct, mirror):
+        arr.setflags(write=False)
+    return direct, mirror, m, counts, present
+
+
+def _radial_sums(img_gray: np.ndarray) -> np.ndarray:
+    """
+    Per-radius sums of the centered, unpadded 20*log(|FFT| + 1e-8) spectrum
+    of img_gray, without materialising the full, shifted spectrum.
+
+    The log-magnitude is computed once over the rfft2 half and binned straight
+    into the radial accumulator; the mirrored half contributes through a
+    second precomputed bin map. For an (N, H, W) stack of same-shape images
+    the FFT runs once over the batch and the result is (N, n_bins).
+    """
+    log_half = _log_magnitude_half(img_gray)
+    direct, mirror, m, counts, _ = _half_spectrum_index(img_gray.shape[-2:])
+
+    def bin_sums(half):
+        sums = np.bincount(direct, weights=half.ravel(), minlength=counts.shape[0])
+        if m:
+            sums += np.bincount(mirror, weights=half[:, 1:m + 1].ravel(), minlength=counts.shape[0])
+        return sums
+
+    if log_half.ndim == 2:
+        return bin_sums(log_half)
+    return np.stack([bin_sums(half) for half in log_half])
+
+
+@lru_cache(maxsize=8)
+def _psd_projection(shape, target_len: int) -> np.ndarray:
+    """
+    (target_len, n_bins) matrix taking radial sums to the classifier's PSD.
+
+    For a given shape everything after binning is linear: dividing by the
+    bin counts, dropping the empty and the outermost/innermost bins (as
+    azimuthalAverage does for the trained classifier) and the np.interp
+    resample to target_len points. Folding them into one cached matrix
+    leaves a single matrix-vector product per image.
+    """
+    _, counts, present = _radial_index(shape)
+    bins = np.flatnonzero(present)[1:-1]
+    n = len(bins)
+
+    if n == target_len:
+        interp = np.eye(n)
+    else:
+        # Same sample points and right-edge clamping as np.interp over arange(n)
+        x = np.linspace(0, n, target_len)
+        left = np.minimum(np.floor(x).astype(np.intp), n - 1)
+        frac = np.where(x >= n - 1, 0.0, x - left)
+        right = np.minimum(left + 1, n - 1)
+        interp = np.zeros((target_len, n))
+        rows = np.arange(target_len)
+        np.add.at(interp, (rows, left), 1.0 - frac)
+        np.add.at(interp, (rows, right), frac)
+
+    projection = np.zeros((target_len, counts.shape[0]))
+    projection[:, bins] = interp / counts[bins]
+    projection.setflags(write=False)
+    return projection
+
+
+def _psd_features(img_gray: np.ndarray, target_len: int = 300) -> np.ndarray:
+    """
+    Azimuthally averaged log spectrum of img_gray, resampled to target_len.
+    An (N, H, W) stack gives one (N, target_len) row per image.
+    """
+    return _radial_sums(img_gray) @ _psd_projection(img_gray.shape[-2:], target_len).T
+
+
 class ForensicAnalyzer:
     """
     Analyzes images in the frequency domain (DCT/DFT) to detect
@@ -19,7 +215,15 @@ class ForensicAnalyzer:
     """
     
     def __init__(self):
-        self.model_path = os.path.join(settings.MODELS_DIR, "forensic_classifier.onnx")
+        # The classifier with its softmax folded into the graph
+        # (scripts/fold_forensic_softmax.py) is preferred, and either one's
+        # INT8-quantized variant when scripts/quantize_models.py has run
+        self.emits_probabilities = os.path.exists(
+            os.path.join(settings.MODELS_DIR, SOFTMAX_MODEL_NAME)
+        )
+        self.model_path = model_path(
+            SOFTMAX_MODEL_NAME if self.emits_probabilities else MODEL_NAME
+        )
         self.scaler_path = os.path.join(settings.MODELS_DIR, "forensic_scaler.pkl")
         self.session = None
         self.scaler = None
@@ -34,7 +238,8 @@ class ForensicAnalyzer:
                 logger.warning(f"Forensic model not found at {self.model_path}")
                 return
 
-            providers = ['CPUExecutionProvider'] # Force CPU for stability
+            # CPU unless ORT_PROVIDERS / USE_GPU select an accelerator
+            providers = execution_providers()
             self.session = ort.InferenceSession(self.model_path, providers=providers)
             self.input_name = self.session.get_inputs()[0].name
             self.output_name = self.session.get_outputs()[0].name
@@ -58,6 +263,11 @@ class ForensicAnalyzer:
     def is_loaded(self) -> bool:
         return self.session is not None
 
+    @property
+    def model_version(self) -> str:
+        """Classifier and scaler files in use, for result provenance."""
+        return f"{file_version(self.model_path)}+{file_version(self.scaler_path)}"
+
     def azimuthalAverage(self, image, center=None):
         """
         Calculate the azimuthally averaged radial profile.
@@ -65,59 +275,43 @@ class ForensicAnalyzer:
         center - The [x,y] pixel coordinates used as the center. The default is 
              None, which then uses the center of the image
         """
-        # Calculate the indices from the image
-        y, x = np.indices(image.shape)
+        if center is None:
+            # Default center: the radius map depends only on the shape, and
+            # extract_features sees a handful of distinct shapes
+            r_int, counts, present = _radial_index(image.shape)
+        else:
+            r_int, counts, present = _radial_bins(image.shape, center)
 
-        if not center:
-            center = np.array([(x.max()-x.min())/2.0, (y.max()-y.min())/2.0])
+        sums = np.bincount(r_int, weights=image.ravel(), minlength=counts.shape[0])
+        radial_prof = sums[present] / counts[present]
 
-        r = np.hypot(x - center[0], y - center[1])
+        # The classifier was trained on the sorted cumulative-sum profile,
+        # which leaves out the innermost and outermost radius bins
+        radial_prof = radial_prof[1:-1]
 
-        # Get sorted radii
-        ind = np.argsort(r.flat)
-        r_sorted = r.flat[ind]
-        i_sorted = image.flat[ind]
-
-        # Get the integer part of the radii (bin size = 1)
-        r_int = r_sorted.astype(int)
+        return radial_prof
 
-        # Find all pixels that fall within each radial bin.
-        deltar = r_int[1:] - r_int[:-1]  # Assumes all radii represented
-        rind = np.where(deltar)[0]       # location of changed radius
-        nr = rind[1:] - rind[:-1]        # number of radius bin
+    @staticmethod
+    def _feature_gray(img_bgr):
+        """Grayscale image the features are computed from, capped at 720p."""
+        img_gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
         
-        # Cumulative sum to figure out sums for each radius bin
-        csim = np.cumsum(i_sorted, dtype=float)
-        tbin = csim[rind[1:]] - csim[rind[:-1]]
-
-        radial_prof = tbin / nr
-
-        return radial_prof
+        # Resize
+        h, w = img_gray.shape
+        min_dim = min(h, w)
+        if min_dim > 720: # Cap size for performance
+            scale = 720 / min_dim
+            img_gray = cv2.resize(img_gray, None, fx=scale, fy=scale)
+        return img_gray
 
     def extract_features(self, img_bgr):
         """Extract frequency domain features from image."""
         try:
-            # Convert to grayscale
-            img_gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+            img_gray = self._feature_gray(img_bgr)
             
-            # Resize
-            h, w = img_gray.shape
-            min_dim = min(h, w)
-            if min_dim > 720: # Cap size for performance
-                scale = 720 / min_dim
-                img_gray = cv2.resize(img_gray, None, fx=scale, fy=scale)
-            
-            f = np.fft.fft2(img_gray)
-            fshift = np.fft.fftshift(f)
-            magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1e-8)
-            
-            # Azimuthal average
-            psd1D = self.azimuthalAverage(magnitude_spectrum)
-            
-            # Normalize to fixed length (e.g. 300 points)
-            target_len = 300
-            if len(psd1D) != target_len:
-                psd1D = np.interp(np.linspace(0, len(psd1D), target_len), np.arange(len(psd1D)), psd1D)
+            # Azimuthal average of the log-magnitude spectrum, normalized to a
+            # fixed length (300 points) by a per-shape cached projection
+            psd1D = _psd_features(img_gray, target_len=300)
             
             # Scale if scaler is available
             if self.scaler:
@@ -129,6 +323,34 @@ class ForensicAnalyzer:
             logger.error(f"Feature extraction failed: {e}")
             return None
 
+    def extract_features_batch(self, images):
+        """
+        Features of several images at once, as an (N, 300) float32 array.
+        
+        Video frames share one shape, so their spectra come from batched
+        rFFTs of up to _FFT_BATCH frames instead of one transform per frame;
+        images of differing shapes are handled one by one.
+        """
+        try:
+            grays = [self._feature_gray(img) for img in images]
+            
+            if len({g.shape for g in grays}) == 1:
+                psd = np.concatenate([
+                    _psd_features(np.stack(grays[i:i + _FFT_BATCH]), target_len=300)
+                    for i in range(0, len(grays), _FFT_BATCH)
+                ])
+            else:
+                psd = np.stack([_psd_features(g, target_len=300) for g in grays])
+            
+            if self.scaler:
+                psd = self.scaler.transform(psd)
+            
+            return psd.astype(np.float32)
+            
+        except Exception as e:
+            logger.error(f"Batch feature extraction failed: {e}")
+            return None
+
     def _generate_ela(self, image: np.ndarray, quality: int = 90) -> str:
         """Generate Error Level Analysis (ELA) image."""
         try:
@@ -139,12 +361,10 @@ class ForensicAnalyzer:
             
             # Enhance contrast
             diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            diff = clahe.apply(diff)
+            diff = _clahe().apply(diff)
             diff = cv2.applyColorMap(diff, cv2.COLORMAP_JET)
             
-            _, buf = cv2.imencode('.jpg', diff)
-            return base64.b64encode(buf).decode('utf-8')
+            return _plot_b64(diff)
         except Exception as e:
             logger.error(f"ELA generation failed: {e}")
             return None
@@ -152,31 +372,42 @@ class ForensicAnalyzer:
     def _generate_spectrum_plot(self, img_gray: np.ndarray) -> str:
         """Generate visual frequency spectrum plot."""
         try:
-            f = np.fft.fft2(img_gray)
-            fshift = np.fft.fftshift(f)
-            magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1e-8)
+            magnitude_spectrum = _log_magnitude_spectrum(img_gray)
             
             # Normalize to 0-255
             mag_norm = cv2.normalize(magnitude_spectrum, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
             mag_color = cv2.applyColorMap(mag_norm, cv2.COLORMAP_INFERNO)
             
-            _, buf = cv2.imencode('.jpg', mag_color)
-            return base64.b64encode(buf).decode('utf-8')
+            return _plot_b64(mag_color)
         except Exception as e:
             logger.error(f"Spectrum plot failed: {e}")
             return None
 
-    def analyze(self, image: np.ndarray) -> dict:
+    def analyze(self, image: np.ndarray, generate_plots: bool = True) -> dict:
         """
         Analyze image for frequency anomalies and generate forensic report.
+        
+        `generate_plots=False` skips the ELA and spectrum visualizations
+        (two JPEG round trips and an extra FFT) for callers that only need
+        the score; their `plots` entries are then None.
         """
         try:
-            # Always generate visualizations
-            import base64
-            img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            plot_futures = None
+            if generate_plots:
+                # ELA, the spectrum plot and feature extraction are independent
+                # and release the GIL in OpenCV / NumPy, so overlap them
+                img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                plot_futures = (
+                    _plot_pool.submit(self._generate_ela, image),
+                    _plot_pool.submit(self._generate_spectrum_plot, img_gray)
+                )
+            
+            features = self.extract_features(image) if self.is_loaded() else None
             
-            ela_b64 = self._generate_ela(image)
-            spectrum_b64 = self._generate_spectrum_plot(img_gray)
+            if plot_futures is not None:
+                ela_b64, spectrum_b64 = (f.result() for f in plot_futures)
+            else:
+                ela_b64 = spectrum_b64 = None
             
             if not self.is_loaded():
                 # Return neutral result but valid plots
@@ -195,54 +426,85 @@ class ForensicAnalyzer:
                     }
                 }
 
-            # Extract features
-            features = self.extract_features(image)
-            
             if features is None:
                 return {"error": "Feature extraction failed"}
             
-            # Add batch dimension
-            input_tensor = np.expand_dims(features, axis=0)
-            
-            # Run inference
-            probs = self.session.run(
-                [self.output_name],
-                {self.input_name: input_tensor}
-            )[0][0]
+            # Add batch dimension and run inference
+            probs = self._infer(np.expand_dims(features, axis=0))[0]
             
-            # Helper for probabilities
-            if isinstance(probs, np.ndarray) and len(probs) == 2:
-                exp_probs = np.exp(probs - np.max(probs))
-                probs = exp_probs / exp_probs.sum()
-                real_prob = float(probs[0])
-                fake_prob = float(probs[1])
-            else:
-                 fake_prob = float(probs)
-                 real_prob = 1.0 - fake_prob
-            
-            risk_score = fake_prob * 100
-            
-            return {
-                "risk_score": round(risk_score, 2),
-                "prediction": {
-                    "fake_probability": round(fake_prob, 4),
-                    "real_probability": round(real_prob, 4)
-                },
-                "classification": "MANIPULATED" if risk_score > 50 else "AUTHENTIC",
-                "method": "Frequency Domain Analysis",
-                "plots": {
-                    "ela": ela_b64,
-                    "spectrum": spectrum_b64
-                },
-                "details": {
-                    "ela_explanation": "Error Level Analysis shows compression artifact inconsistencies. High contrast areas indicate potential manipulation.",
-                    "spectrum_explanation": "Frequency spectrum analysis detects upsampling artifacts common in GAN-generated faces."
-                }
-            }
+            return self._scored_result(probs, ela_b64, spectrum_b64)
             
         except Exception as e:
             logger.error(f"Forensic analysis failed: {e}")
             return {"error": str(e)}
 
+    def analyze_batch(self, images) -> list:
+        """
+        Score several images, e.g. sampled video frames, without plots.
+        
+        Equivalent to analyze(image, generate_plots=False) for each image,
+        but features come from batched FFTs and, when the model's batch
+        dimension is dynamic, the classifier runs once for all of them.
+        """
+        if not images:
+            return []
+        if not self.is_loaded():
+            return [self.analyze(img, generate_plots=False) for img in images]
+        
+        try:
+            features = self.extract_features_batch(images)
+            if features is None:
+                return [{"error": "Feature extraction failed"} for _ in images]
+            
+            return [self._scored_result(probs, None, None) for probs in self._infer(features)]
+            
+        except Exception as e:
+            logger.error(f"Forensic batch analysis failed: {e}")
+            return [{"error": str(e)} for _ in images]
+
+    def _infer(self, batch: np.ndarray) -> np.ndarray:
+        """Classifier outputs for an (N, 300) feature batch, one row per image."""
+        if self.session.get_inputs()[0].shape[0] == 1:
+            # Exported with a fixed batch of one
+            return np.concatenate([
+                self.session.run([self.output_name], {self.input_name: row[np.newaxis]})[0]
+                for row in batch
+            ])
+        return self.session.run([self.output_name], {self.input_name: batch})[0]
+
+    def _scored_result(self, probs, ela_b64, spectrum_b64) -> dict:
+        """Report for one image from its classifier output."""
+        # Helper for probabilities
+        if isinstance(probs, np.ndarray) and len(probs) == 2:
+            if not self.emits_probabilities:
+                exp_probs = np.exp(probs - np.max(probs))
+                probs = exp_probs / exp_probs.sum()
+            real_prob = float(probs[0])
+            fake_prob = float(probs[1])
+        else:
+             fake_prob = float(probs)
+             real_prob = 1.0 - fake_prob
+        
+        risk_score = fake_prob * 100
+        
+        return {
+            "risk_score": round(risk_score, 2),
+            "prediction": {
+                "fake_probability": round(fake_prob, 4),
+                "real_probability": round(real_prob, 4)
+            },
+            "classification": "MANIPULATED" if risk_score > 50 else "AUTHENTIC",
+            "method": "Frequency Domain Analysis",
+            "plots": {
+                "ela": ela_b64,
+                "spectrum": spectrum_b64
+            },
+            "details": {
+                "ela_explanation": "Error Level Analysis shows compression artifact inconsistencies. High contrast areas indicate potential manipulation.",
+                "spectrum_explanation": "Frequency spectrum analysis detects upsampling artifacts common in GAN-generated faces."
+            }
+        }
+
+
 # Singleton
 forensic_analyzer = ForensicAnalyzer()
@@ -1,5 +1,5 @@
 """Fusion Engine - Combines signals from multiple detectors."""
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import numpy as np
 import logging
 
@@ -63,6 +63,32 @@ class FusionEngine:
         
         return (weighted_sum / total_weight) * 100
     
+    def weighted_ensemble(
+        self,
+        signals: Dict[str, Dict[str, Any]],
+        weights: Dict[str, float]
+    ) -> Tuple[float, str]:
+        """
+        Combine per-analyzer risk scores into one ensemble score.
+        
+        Args:
+            signals: Dict of signal_name -> result dict with a 'risk_score' (0-100)
+            weights: Dict of signal_name -> weight; missing signals are skipped
+                and the remaining weights renormalized
+            
+        Returns:
+            (risk_score, classification)
+        """
+        keys = [k for k in weights if k in signals]
+        if not keys:
+            return 50.0, self.classify(50.0)  # Neutral if no signals
+        
+        w = np.array([weights[k] for k in keys], dtype=np.float64)
+        s = np.array([signals[k]['risk_score'] for k in keys], dtype=np.float64)
+        risk_score = float(w @ s / w.sum())
+        
+        return risk_score, self.classify(risk_score)
+    
     def classify(self, risk_score: float) -> str:
         """
         Classify based on risk score.
@@ -0,0 +1,35 @@
+"""
+Image statistics shared by the OpenCV-based analyses
+"""
+import cv2
+import numpy as np
+from typing import Callable, Optional
+
+
+def mean_local_variance(
+    gray: np.ndarray,
+    kernel_size: int = 5,
+    scratch: Optional[Callable[[str, tuple], np.ndarray]] = None
+) -> float:
+    """
+    Average local variance, E[x^2] - E[x]^2 over kernel_size windows.
+    
+    Only its mean is needed, so the two window images are reduced directly:
+    the mean of E[x]^2 is a squared L2 norm, and no per-pixel variance image
+    is written (both reductions accumulate in double).
+    
+    `scratch(name, shape)` may supply reusable float32 buffers for the
+    intermediate images; they are allocated per call otherwise.
+    """
+    ksize = (kernel_size, kernel_size)
+    if scratch is None:
+        gray_f = np.float32(gray)
+        mean = cv2.blur(gray_f, ksize)
+        sq_mean = cv2.sqrBoxFilter(gray_f, -1, ksize)
+    else:
+        gray_f = scratch("variance_gray", gray.shape)
+        np.copyto(gray_f, gray)
+        mean = cv2.blur(gray_f, ksize, dst=scratch("variance_mean", gray.shape))
+        sq_mean = cv2.sqrBoxFilter(gray_f, -1, ksize, dst=scratch("variance_sq_mean", gray.shape))
+    
+    return cv2.mean(sq_mean)[0] - cv2.norm(mean, cv2.NORM_L2SQR) / mean.size
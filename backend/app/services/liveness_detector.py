@@ -9,10 +9,16 @@ This service provides:
 """
 
 import logging
+import os
+import threading
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
 
+from app.config import settings
+from app.services.image_stats import mean_local_variance
+
 logger = logging.getLogger(__name__)
 
 # Try to import DeepFace for face detection
@@ -24,9 +30,89 @@ try:
 except ImportError:
     logger.warning("DeepFace not installed. Using OpenCV for face detection.")
 
-# OpenCV face detector fallback
+# OpenCV face detector fallback, parsed once at import
 face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
 
+# YuNet CNN face detector: faster and more accurate than the Haar scan
+_YUNET_PATH = os.path.join(settings.MODELS_DIR, settings.LIVENESS_FACE_MODEL)
+YUNET_AVAILABLE = hasattr(cv2, "FaceDetectorYN") and os.path.exists(_YUNET_PATH)
+
+# YuNet detects on at most this many pixels on the longer side
+_YUNET_MAX_SIDE = 640
+
+# Per-thread state: cv2.FaceDetectorYN holds its input size and buffers, and
+# the sub-analyses' float32 scratch images are reused between calls
+_thread_state = threading.local()
+
+
+def _downscale(image: np.ndarray, max_side: int) -> np.ndarray:
+    """
+    Shrink so the longer side is at most `max_side` (aspect kept); never
+    upscales. A `max_side` of 0 or less returns the image unchanged.
+    """
+    if max_side <= 0:
+        return image
+    h, w = image.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1:
+        return image
+    return cv2.resize(
+        image, (max(1, round(w * scale)), max(1, round(h * scale))),
+        interpolation=cv2.INTER_AREA
+    )
+
+
+# Fusion weights of the four sub-analyses; face confidence adds a 10% bonus
+_FUSION_WEIGHTS = {
+    "texture": 0.30,
+    "blur": 0.25,
+    "color": 0.25,
+    "moire": 0.20
+}
+_FACE_WEIGHT = 0.1
+
+# Attack each of the texture, moire and blur scores is weakest against
+_ATTACK_TYPES = ("print", "screen_replay", "photo")
+
+# Reported in place of the moire analysis when the early exit skips it;
+# its score is never fused or used for the attack type
+_SKIPPED = {"score": None, "result": "skipped", "skipped": True}
+
+
+def _confidence_level(score: float) -> str:
+    """Confidence band of a fused liveness score."""
+    if score >= 0.8:
+        return "VERY_HIGH"
+    if score >= 0.65:
+        return "HIGH"
+    if score >= 0.5:
+        return "MEDIUM"
+    return "LOW"
+
+
+def _yunet() -> "cv2.FaceDetectorYN":
+    """This thread's YuNet detector, created on first use."""
+    detector = getattr(_thread_state, "yunet", None)
+    if detector is None:
+        detector = cv2.FaceDetectorYN.create(_YUNET_PATH, "", (320, 320), 0.6, 0.3, 5000)
+        _thread_state.yunet = detector
+    return detector
+
+
+def _scratch(name: str, shape: tuple, dtype=np.float32) -> np.ndarray:
+    """
+    This thread's scratch buffer `name`, reallocated only when the shape
+    changes. Frames of one stream share a shape, so after the first call the
+    sub-analyses write into the same memory instead of fresh allocations.
+    """
+    buffers = getattr(_thread_state, "buffers", None)
+    if buffers is None:
+        buffers = _thread_state.buffers = {}
+    buf = buffers.get(name)
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = buffers[name] = np.empty(shape, dtype=dtype)
+    return buf
+
 
 class LivenessDetector:
     """
@@ -42,7 +128,12 @@ class LivenessDetector:
     
     def __init__(self):
         self._loaded = True
-        if DEEPFACE_AVAILABLE:
+        # The four sub-analyses are independent OpenCV/NumPy work that
+        # releases the GIL, so detect() overlaps them on this pool
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="liveness")
+        if YUNET_AVAILABLE:
+            logger.info("✓ Liveness Detector initialized with YuNet")
+        elif DEEPFACE_AVAILABLE:
             logger.info("✓ Liveness Detector initialized with DeepFace")
         else:
             logger.info("✓ Liveness Detector initialized with OpenCV")
@@ -51,12 +142,26 @@ class LivenessDetector:
         """Check if service is available."""
         return self._loaded
     
-    def _detect_face(self, image: np.ndarray) -> Dict[str, Any]:
-        """Detect face in image using available method."""
+    def _detect_face(self, img_bgr: np.ndarray) -> Dict[str, Any]:
+        """Detect face in a BGR image using available method."""
         try:
+            if YUNET_AVAILABLE:
+                small = _downscale(img_bgr, _YUNET_MAX_SIDE)
+                detector = _yunet()
+                detector.setInputSize((small.shape[1], small.shape[0]))
+                _, faces = detector.detect(small)
+                
+                # Rows are [x, y, w, h, 5 landmarks (x, y), score]
+                if faces is not None and len(faces) > 0:
+                    return {
+                        "detected": True,
+                        "confidence": float(faces[:, -1].max()),
+                        "method": "yunet"
+                    }
+                return {"detected": False, "confidence": 0.0, "method": "yunet"}
+            
             if DEEPFACE_AVAILABLE:
                 # Use DeepFace for face detection
-                img_bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
                 faces = DeepFace.extract_faces(
                     img_bgr, 
                     detector_backend='opencv',
@@ -72,7 +177,7 @@ class LivenessDetector:
                     }
             
             # Fallback to OpenCV Haar Cascade
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
             faces = face_cascade.detectMultiScale(gray, 1.1, 4)
             
             if len(faces) > 0:
@@ -88,18 +193,11 @@ class LivenessDetector:
             logger.error(f"Face detection failed: {e}")
             return {"detected": False, "confidence": 0.0, "error": str(e)}
     
-    def _analyze_texture(self, image: np.ndarray) -> Dict[str, Any]:
+    def _analyze_texture(self, gray: np.ndarray) -> Dict[str, Any]:
         """Analyze texture using Local Binary Patterns approach."""
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            
-            # Calculate local variance
-            kernel_size = 5
-            mean = cv2.blur(gray.astype(float), (kernel_size, kernel_size))
-            sqr_mean = cv2.blur(gray.astype(float)**2, (kernel_size, kernel_size))
-            variance = sqr_mean - mean**2
-            
-            avg_variance = float(np.mean(variance))
+            # Average local variance over 5x5 windows
+            avg_variance = mean_local_variance(gray, 5, scratch=_scratch)
             texture_score = min(avg_variance / 500.0, 1.0)
             
             return {
@@ -109,13 +207,15 @@ class LivenessDetector:
         except Exception as e:
             return {"score": 0.5, "result": "unknown", "error": str(e)}
     
-    def _analyze_blur(self, image: np.ndarray) -> Dict[str, Any]:
+    def _analyze_blur(self, gray: np.ndarray) -> Dict[str, Any]:
         """Detect print/replay attacks via blur analysis."""
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            
-            # Laplacian variance (sharpness indicator)
-            laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+            # Laplacian variance (sharpness indicator). The 3x3 Laplacian of
+            # uint8 input is integral, so float32 holds it exactly, and
+            # meanStdDev gets the variance in one pass
+            laplacian = cv2.Laplacian(gray, cv2.CV_32F, dst=_scratch("laplacian", gray.shape))
+            _, stddev = cv2.meanStdDev(laplacian)
+            laplacian_var = float(stddev[0, 0]) ** 2
             
             # Sharp images are more likely to be live
             # Very blurry = print/screen; Very sharp = possibly digital
@@ -134,16 +234,13 @@ class LivenessDetector:
         except Exception as e:
             return {"score": 0.5, "result": "unknown", "error": str(e)}
     
-    def _analyze_color(self, image: np.ndarray) -> Dict[str, Any]:
+    def _analyze_color(self, hsv: np.ndarray) -> Dict[str, Any]:
         """Analyze color distribution for spoofing indicators."""
         try:
-            hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-            
-            saturation = hsv[:, :, 1]
-            sat_std = float(np.std(saturation))
-            
-            hue = hsv[:, :, 0]
-            hue_std = float(np.std(hue))
+            # Per-channel standard deviations of H, S, V in one pass
+            _, stddev = cv2.meanStdDev(hsv)
+            hue_std = float(stddev[0, 0])
+            sat_std = float(stddev[1, 0])
             
             color_score = min((sat_std / 50.0 + hue_std / 30.0) / 2, 1.0)
             
@@ -154,20 +251,37 @@ class LivenessDetector:
         except Exception as e:
             return {"score": 0.5, "result": "unknown", "error": str(e)}
     
-    def _detect_moire(self, image: np.ndarray) -> Dict[str, Any]:
+    def _detect_moire(self, gray: np.ndarray) -> Dict[str, Any]:
         """Detect moiré patterns from screen replay attacks."""
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            # OpenCV's float32 DFT on the image zero-padded to a fast
+            # (2/3/5-smooth) size; only the magnitude is needed
+            h, w = gray.shape
+            dft_shape = (cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w))
+            padded = _scratch("moire_padded", dft_shape)
+            padded[:h, :w] = gray
+            padded[h:] = 0
+            padded[:h, w:] = 0
+            dft = cv2.dft(
+                padded, dst=_scratch("moire_dft", dft_shape + (2,)),
+                flags=cv2.DFT_COMPLEX_OUTPUT
+            )
             
-            f = np.fft.fft2(gray)
-            fshift = np.fft.fftshift(f)
-            magnitude = np.log(np.abs(fshift) + 1)
+            # The input is real, so the spectrum is Hermitian-symmetric and
+            # the non-negative-frequency half carries every magnitude; only
+            # the peak-to-mean ratio is used, so no fftshift is needed either
+            half = dft[:, :dft.shape[1] // 2 + 1]
+            magnitude = cv2.magnitude(half[..., 0], half[..., 1])
+            # The log is not cosmetic: peak/mean of log(|F| + 1) is far from
+            # peak/mean of |F|, and the /10 scale below is tuned to the former
+            np.log1p(magnitude, out=magnitude)
             
-            center = (magnitude.shape[0] // 2, magnitude.shape[1] // 2)
-            magnitude[center[0]-5:center[0]+5, center[1]-5:center[1]+5] = 0
+            # Zero the DC neighbourhood, which unshifted sits in the corners
+            magnitude[:5, :5] = 0
+            magnitude[-5:, :5] = 0
             
-            max_peak = float(np.max(magnitude))
-            mean_magnitude = float(np.mean(magnitude))
+            _, max_peak, _, _ = cv2.minMaxLoc(magnitude)
+            mean_magnitude = cv2.mean(magnitude)[0]
             peak_ratio = max_peak / (mean_magnitude + 1e-6)
             
             moire_score = max(0, 1 - (peak_ratio / 10))
@@ -182,7 +296,8 @@ class LivenessDetector:
     def detect(
         self, 
         image: np.ndarray,
-        security_level: str = "standard"
+        security_level: str = "standard",
+        is_bgr: bool = False
     ) -> Dict[str, Any]:
         """
         Perform comprehensive liveness detection.
@@ -190,6 +305,8 @@ class LivenessDetector:
         Args:
             image: RGB image as numpy array
             security_level: "standard", "high", or "banking_kyc"
+            is_bgr: The image is already BGR (e.g. straight from cv2.imdecode);
+                everything below works from BGR, so RGB is converted once
             
         Returns:
             Liveness detection result with scores
@@ -201,8 +318,10 @@ class LivenessDetector:
         }
         threshold = thresholds.get(security_level, 0.5)
         
+        img_bgr = image if is_bgr else cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        
         # First check if face is detected
-        face_result = self._detect_face(image)
+        face_result = self._detect_face(img_bgr)
         
         if not face_result.get("detected", False):
             return {
@@ -215,51 +334,58 @@ class LivenessDetector:
                 "methods": {}
             }
         
-        # Run all detection methods
-        texture_result = self._analyze_texture(image)
-        blur_result = self._analyze_blur(image)
-        color_result = self._analyze_color(image)
-        moire_result = self._detect_moire(image)
+        # Converted to gray / HSV once for all of the sub-analyses. Their
+        # thresholds are tuned at full resolution, so the optional size cap
+        # (LIVENESS_ANALYSIS_MAX_SIDE) is off unless configured
+        small = _downscale(img_bgr, settings.LIVENESS_ANALYSIS_MAX_SIDE)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
         
-        # Weighted fusion
-        weights = {
-            "texture": 0.30,
-            "blur": 0.25,
-            "color": 0.25,
-            "moire": 0.20
-        }
+        # Run the cheap analyses concurrently first
+        texture_future = self._pool.submit(self._analyze_texture, gray)
+        blur_future = self._pool.submit(self._analyze_blur, gray)
+        color_future = self._pool.submit(self._analyze_color, hsv)
         
-        fused_score = (
-            texture_result["score"] * weights["texture"] +
-            blur_result["score"] * weights["blur"] +
-            color_result["score"] * weights["color"] +
-            moire_result["score"] * weights["moire"]
-        )
+        texture_result = texture_future.result()
+        blur_result = blur_future.result()
+        color_result = color_future.result()
         
-        # Add face detection confidence bonus
-        fused_score = fused_score * 0.9 + face_result.get("confidence", 0.8) * 0.1
+        # Weighted fusion
+        partial_score = (
+            texture_result["score"] * _FUSION_WEIGHTS["texture"] +
+            blur_result["score"] * _FUSION_WEIGHTS["blur"] +
+            color_result["score"] * _FUSION_WEIGHTS["color"]
+        ) * (1 - _FACE_WEIGHT) + face_result.get("confidence", 0.8) * _FACE_WEIGHT
+        
+        # The moire score lies in [0, 1], so the fused score ends up in
+        # [partial_score, partial_score + moire_span]. The FFT is skipped
+        # only on the live side and when both ends share a confidence band:
+        # a spoof needs the real moire score for its attack type. A skipped
+        # run reports the lower bound as its confidence.
+        moire_span = _FUSION_WEIGHTS["moire"] * (1 - _FACE_WEIGHT)
+        if (
+            settings.LIVENESS_EARLY_EXIT
+            and partial_score >= threshold
+            and _confidence_level(partial_score) == _confidence_level(partial_score + moire_span)
+        ):
+            moire_result = dict(_SKIPPED)
+            fused_score = partial_score
+        else:
+            moire_result = self._detect_moire(gray)
+            fused_score = partial_score + moire_result["score"] * moire_span
         
         is_live = fused_score >= threshold
         
         # Determine attack type
         attack_type = None
         if not is_live:
-            scores = {
-                "print": 1 - texture_result["score"],
-                "screen_replay": 1 - moire_result["score"],
-                "photo": 1 - blur_result["score"]
-            }
-            attack_type = max(scores, key=scores.get)
+            # Lowest of the texture / moire / blur scores; ties go to the
+            # first, as with max over the former score dict
+            attack_scores = (texture_result["score"], moire_result["score"], blur_result["score"])
+            attack_type = _ATTACK_TYPES[attack_scores.index(min(attack_scores))]
         
         # Confidence level
-        if fused_score >= 0.8:
-            confidence_level = "VERY_HIGH"
-        elif fused_score >= 0.65:
-            confidence_level = "HIGH"
-        elif fused_score >= 0.5:
-            confidence_level = "MEDIUM"
-        else:
-            confidence_level = "LOW"
+        confidence_level = _confidence_level(fused_score)
         
         return {
             "is_live": is_live,
@@ -277,7 +403,11 @@ class LivenessDetector:
                 "color_analysis": color_result,
                 "moire_detection": moire_result
             },
-            "model": "DeepFace+OpenCV" if DEEPFACE_AVAILABLE else "OpenCV"
+            "model": (
+                "YuNet+OpenCV" if YUNET_AVAILABLE
+                else "DeepFace+OpenCV" if DEEPFACE_AVAILABLE
+                else "OpenCV"
+            )
         }
 
 
@@ -0,0 +1,111 @@
+"""
+Micro-batching for model inference.
+
+Coalesces concurrent single-item calls (one per request thread) into one
+batched model run on a background worker, so models see batch > 1 under
+load without any caller having to batch explicitly.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Batches items submitted from many threads for `run_batch`.
+
+    `run_batch` takes a list of items and returns one output per item, in
+    order. The worker takes everything already queued, up to `max_batch`;
+    only when that already found concurrent work does it wait up to
+    `max_wait` seconds for more, so a lone request never pays the wait.
+    Callers wait at most `timeout` seconds for their output.
+    """
+    
+    # Seconds a caller waits for its batch before giving up
+    DEFAULT_TIMEOUT = 60.0
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Any]],
+        max_batch: int,
+        max_wait: float,
+        name: str = "micro-batcher",
+        timeout: float = DEFAULT_TIMEOUT
+    ):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.timeout = timeout
+        self._run_batch = run_batch
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item; the future resolves to its output."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """
+        Run one item through the next batch and wait for its output.
+        
+        Raises concurrent.futures.TimeoutError after `timeout` seconds.
+        """
+        return self.submit(item).result(timeout=self.timeout)
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+
+        # Whatever arrived meanwhile joins without waiting
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        # Under concurrent load, give stragglers a short window to join
+        if 1 < len(batch) < self.max_batch and self.max_wait > 0:
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                outputs = list(self._run_batch(items))
+                if len(outputs) != len(items):
+                    raise RuntimeError(
+                        f"run_batch returned {len(outputs)} outputs for {len(items)} items"
+                    )
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(items)} failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
@@ -0,0 +1,96 @@
+"""
+ONNX Runtime helpers shared by the services that run exported models
+
+Execution provider selection, the INT8 model variant lookup, common
+session options, and model file versioning for result provenance.
+"""
+import os
+import logging
+import onnxruntime as ort
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def execution_providers() -> list:
+    """
+    ONNX Runtime providers for the forensic and DeepFace sessions.
+
+    ORT_PROVIDERS wins when set. Otherwise USE_GPU selects TensorRT (FP16,
+    with a persistent engine cache) then CUDA, always ending in CPU; providers
+    this onnxruntime build lacks are dropped so CPU-only installs still load.
+    """
+    if settings.ORT_PROVIDERS:
+        return list(settings.ORT_PROVIDERS)
+
+    if not settings.USE_GPU:
+        return ['CPUExecutionProvider']
+
+    trt_options = {
+        'trt_fp16_enable': True,
+        'trt_engine_cache_enable': True,
+        'trt_engine_cache_path': os.path.join(settings.MODELS_DIR, settings.TRT_CACHE),
+    }
+    available = set(ort.get_available_providers())
+    providers = [
+        p for p in (
+            ('TensorrtExecutionProvider', trt_options),
+            'CUDAExecutionProvider',
+        )
+        if (p[0] if isinstance(p, tuple) else p) in available
+    ]
+    return providers + ['CPUExecutionProvider']
+
+
+def model_path(filename: str) -> str:
+    """
+    Path of `filename` in MODELS_DIR, or of its INT8-quantized variant
+    (`<name>_int8.onnx`) when one exists and USE_INT8_MODELS is on.
+    """
+    path = os.path.join(settings.MODELS_DIR, filename)
+    if settings.USE_INT8_MODELS:
+        root, ext = os.path.splitext(path)
+        quantized = root + "_int8" + ext
+        if os.path.exists(quantized):
+            logger.info(f"USE_INT8_MODELS: using quantized {quantized}")
+            return quantized
+    return path
+
+
+def file_version(path: str) -> str:
+    """`name@mtime` of a model file, identifying the weights behind a stored result."""
+    try:
+        return f"{os.path.basename(path)}@{int(os.path.getmtime(path))}"
+    except OSError:
+        return f"{os.path.basename(path)}@missing"
+
+
+def session_options() -> ort.SessionOptions:
+    """Full graph optimisation, sequential execution, one intra-op thread per core."""
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    so.intra_op_num_threads = os.cpu_count() or 1
+    return so
+
+
+def load_session(filename: str) -> Optional[ort.InferenceSession]:
+    """
+    Open an exported model from MODELS_DIR with full graph optimisation.
+
+    Returns None when the file has not been exported, so callers can keep
+    their framework path as the fallback.
+    """
+    path = model_path(filename)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        session = ort.InferenceSession(path, sess_options=session_options(), providers=execution_providers())
+        logger.info(f"✓ ONNX model loaded from {path}")
+        return session
+    except Exception as e:
+        logger.error(f"Failed to load ONNX model {path}: {e}")
+        return None
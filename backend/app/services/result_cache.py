@@ -0,0 +1,94 @@
+"""
+Result Cache Service - In-process TTL + LRU cache for analysis results
+Keyed by a hash of the uploaded content so identical re-uploads skip inference
+"""
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Keys never leave the process, so any collision-resistant digest will do.
+# BLAKE3 is SIMD-parallel and several times faster than SHA-256 on large
+# uploads; fall back to hashlib when it is not installed.
+try:
+    from blake3 import blake3 as _content_digest
+except ImportError:
+    _content_digest = hashlib.sha256
+
+
+class ResultCache:
+    """
+    Small LRU cache with per-entry expiry.
+
+    Each uvicorn worker holds its own cache; entries are evicted when they
+    are older than `ttl_seconds` or when `max_entries` is exceeded.
+    Setting `max_entries` to 0 disables caching.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(namespace: str, content: bytes, *params) -> str:
+        """Build a cache key from an endpoint namespace, the content hash and any request params."""
+        return ResultCache.make_key_from_digest(namespace, _content_digest(content).hexdigest(), *params)
+    
+    @staticmethod
+    def make_key_from_digest(namespace: str, digest: str, *params) -> str:
+        """As make_key, for content hashed incrementally with content_hasher()."""
+        return ":".join([namespace, *(str(p) for p in params), digest])
+    
+    @staticmethod
+    def content_hasher():
+        """New incremental hasher producing the same digest make_key uses."""
+        return _content_digest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        if self.max_entries <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entries if full."""
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all cached entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+# Singleton instance
+result_cache = ResultCache(
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS
+)
@@ -5,15 +5,53 @@ Input: 16 frames, 112x112, RGB, normalized
 Output: Binary (Real=0, Fake=1)
 """
 import cv2
+import math
 import numpy as np
 import onnxruntime as ort
 import os
 import logging
+import threading
 
 from app.config import settings
+from app.services.onnx_runtime import model_path, session_options
+from app.services.micro_batcher import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
+# Optional PyAV decode: frame-threaded, and only sampled frames are converted
+PYAV_AVAILABLE = False
+try:
+    import av
+    PYAV_AVAILABLE = True
+except ImportError:
+    logger.debug("PyAV not available; using OpenCV for temporal frame decode")
+
+
+# x / 255 for every uint8 x, with the same float32 rounding as dividing
+_UNIT_LUT = np.arange(256, dtype=np.float32) / 255.0
+
+# Per-thread frame buffers reused across _extract_frames calls
+_thread_state = threading.local()
+
+
+class _RotatedVideo(Exception):
+    """The PyAV stream carries a display rotation PyAV decode would ignore."""
+
+
+def _two_class_probs(logits) -> tuple:
+    """
+    (p0, p1) softmax of two logits, as Python floats.
+    
+    For two classes softmax is a logistic of the logit difference: one exp
+    on scalars instead of array max/exp/sum. The exp argument is never
+    positive, so it cannot overflow however far apart the logits are.
+    """
+    diff = float(logits[1]) - float(logits[0])
+    e = math.exp(-abs(diff))
+    p_larger = 1.0 / (1.0 + e)
+    p_smaller = e / (1.0 + e)
+    return (p_smaller, p_larger) if diff >= 0 else (p_larger, p_smaller)
+
 
 class TemporalDetector:
     """
@@ -36,16 +74,43 @@ class TemporalDetector:
     
     # CORRECT model filename
     MODEL_FILE = "Temporal_deepfake_Video.onnx"
+    # MODEL_FILE with its external data inlined, written by
+    # scripts/inline_temporal_onnx.py; loaded in preference when present
+    SINGLE_FILE_MODEL = "Temporal_deepfake_Video_single.onnx"
+    EXTERNAL_DATA_FILE = "deepfake_3dcnn_final1.onnx.data"
     
     # Preprocessing constants (from training)
     NUM_FRAMES = 16
     FRAME_SIZE = (112, 112)  # (width, height)
+    # Training resized with cv2.resize's default bilinear filter; INTER_AREA
+    # would be cheaper on large downscales but shifts the input distribution
+    INTERPOLATION = cv2.INTER_LINEAR
+    
+    # Gaps between sampled frames up to this long are stepped through with
+    # grab(); longer ones seek, which restarts decoding at a keyframe
+    MAX_SCAN_GAP = 250
+    
+    # Micro-batching of concurrent analyze() calls into one session run
+    MAX_BATCH = 4
+    BATCH_WAIT = 0.02  # seconds
+    
+    # Graph-optimised copy of MODEL_FILE kept next to it between runs
+    OPTIMIZED_SUFFIX = ".optimized.onnx"
     
     def __init__(self):
-        self.model_path = os.path.join(settings.MODELS_DIR, self.MODEL_FILE)
+        # The INT8 variant from scripts/quantize_models.py when present
+        self.single_file = os.path.exists(
+            os.path.join(settings.MODELS_DIR, self.SINGLE_FILE_MODEL)
+        )
+        self.model_path = model_path(
+            self.SINGLE_FILE_MODEL if self.single_file else self.MODEL_FILE
+        )
         self.session = None
         self.input_name = None
         self.output_name = None
+        self._batcher = None
+        # Per-thread IOBinding state of this detector (see _run_bound)
+        self._bound = threading.local()
         self._loaded = False
         
         self._load_model()
@@ -57,17 +122,23 @@ class TemporalDetector:
                 logger.error(f"Temporal model not found: {self.model_path}")
                 return
             
-            # Check for external data file (the ONNX references deepfake_3dcnn_final1.onnx.data)
-            expected_data_file = os.path.join(settings.MODELS_DIR, "deepfake_3dcnn_final1.onnx.data")
-            if not os.path.exists(expected_data_file):
-                logger.error(f"ONNX external data file not found: {expected_data_file}")
-                return
+            # Only the original split model references the external data file;
+            # the single-file and quantized models carry their weights inline
+            if self.model_path == os.path.join(settings.MODELS_DIR, self.MODEL_FILE):
+                expected_data_file = os.path.join(settings.MODELS_DIR, self.EXTERNAL_DATA_FILE)
+                if not os.path.exists(expected_data_file):
+                    logger.error(f"ONNX external data file not found: {expected_data_file}")
+                    return
             
             # Use CPU only for stability
             providers = ['CPUExecutionProvider']
             
             logger.info(f"Loading Temporal Detector from {self.model_path}...")
-            self.session = ort.InferenceSession(self.model_path, providers=providers)
+            self.session = ort.InferenceSession(
+                self._optimized_model_path(providers),
+                sess_options=session_options(),
+                providers=providers
+            )
             
             self.input_name = self.session.get_inputs()[0].name
             self.output_name = self.session.get_outputs()[0].name
@@ -77,6 +148,12 @@ class TemporalDetector:
             logger.info(f"Temporal model input shape: {input_shape}")
             logger.info(f"Expected: [1, 3, 16, 112, 112]")
             
+            # Concurrent requests share session runs when the batch axis is dynamic
+            if not isinstance(input_shape[0], int):
+                self._batcher = MicroBatcher(
+                    self._run_clips, self.MAX_BATCH, self.BATCH_WAIT, name="temporal-batcher"
+                )
+            
             self._loaded = True
             logger.info("Temporal Detector loaded successfully")
             
@@ -85,6 +162,75 @@ class TemporalDetector:
             self.session = None
             self._loaded = False
     
+    def _optimized_model_path(self, providers: list) -> str:
+        """
+        Path of a graph-optimised copy of the model, written on first load.
+        
+        The copy keeps only the portable (EXTENDED) rewrites and inlines the
+        external data file, so later loads skip those passes and the
+        hardware-specific layout passes still run per machine. Falls back to
+        the original model if the copy cannot be written.
+        """
+        optimized_path = os.path.splitext(self.model_path)[0] + self.OPTIMIZED_SUFFIX
+        if (
+            os.path.exists(optimized_path)
+            and os.path.getmtime(optimized_path) >= os.path.getmtime(self.model_path)
+        ):
+            return optimized_path
+        
+        try:
+            so = ort.SessionOptions()
+            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+            so.optimized_model_filepath = optimized_path
+            ort.InferenceSession(self.model_path, sess_options=so, providers=providers)
+            logger.info(f"Cached optimized temporal model at {optimized_path}")
+            return optimized_path
+        except Exception as e:
+            logger.warning(f"Could not cache optimized temporal model: {e}")
+            return self.model_path
+    
+    def _run_clips(self, clips: list) -> list:
+        """Logits for several (1, 3, 16, 112, 112) clips from one session run."""
+        batch = clips[0] if len(clips) == 1 else np.concatenate(clips)
+        logits = self.session.run([self.output_name], {self.input_name: batch})[0]
+        return list(logits)
+    
+    def _run_bound(self, clip: np.ndarray) -> np.ndarray:
+        """
+        Logits for one clip through this thread's IOBinding.
+        
+        The clip is bound in place (no copy into ORT memory) and, when the
+        output shape is static, the logits land in a preallocated per-thread
+        buffer, so a run allocates nothing for its input or output. The
+        returned row is a view of that buffer, valid until this thread's
+        next run. The binding records the session it was made from and is
+        rebuilt if self.session has been replaced since.
+        """
+        session = self.session
+        bound = self._bound
+        if getattr(bound, "session", None) is not session:
+            bound.io_binding = session.io_binding()
+            output = session.get_outputs()[0]
+            bound.logits = None
+            if output.type == 'tensor(float)' and all(isinstance(d, int) for d in output.shape):
+                bound.logits = np.empty(output.shape, dtype=np.float32)
+                # The OrtValue borrows the array's memory, so both are kept
+                bound.logits_value = ort.OrtValue.ortvalue_from_numpy(bound.logits)
+                bound.io_binding.bind_ortvalue_output(output.name, bound.logits_value)
+            else:
+                bound.io_binding.bind_output(output.name)
+            bound.input_name = session.get_inputs()[0].name
+            bound.session = session
+        
+        binding = bound.io_binding
+        binding.bind_cpu_input(bound.input_name, clip)
+        session.run_with_iobinding(binding)
+        
+        logits = bound.logits
+        if logits is None:
+            logits = binding.copy_outputs_to_cpu()[0]
+        return logits[0]
+    
     def load_model(self) -> bool:
         """Public method for startup check."""
         if not self._loaded:
@@ -109,72 +255,223 @@ class TemporalDetector:
         Returns:
             np.ndarray of shape (1, 3, 16, 112, 112)
         """
-        cap = cv2.VideoCapture(video_path)
+        frames = self._frame_buffer()
         
-        if not cap.isOpened():
-            logger.error(f"Cannot open video: {video_path}")
-            return None
+        count = self._read_frames_pyav(video_path, frames) if PYAV_AVAILABLE else None
+        if count is None:
+            count = self._read_frames_cv2(video_path, frames)
+            if count is None:
+                return None
         
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Ensure exactly NUM_FRAMES
+        if count == 0:
+            frames[0] = 0
+            count = 1
+        frames[count:] = frames[count - 1]
+        
+        # Write each (H, W, C) frame straight into a contiguous
+        # (1, C, T, H, W) = (1, 3, 16, 112, 112) tensor, normalizing to
+        # [0, 1] by table lookup in the same pass; ONNX Runtime then takes
+        # it without a copy
+        width, height = self.FRAME_SIZE
+        video_data = np.empty((1, 3, self.NUM_FRAMES, height, width), dtype=np.float32)
+        for t, frame in enumerate(frames):
+            np.take(_UNIT_LUT, frame.transpose(2, 0, 1), out=video_data[0, :, t], mode='clip')
+        
+        logger.debug(f"Preprocessed video shape: {video_data.shape}")
+        
+        return video_data
+    
+    def _frame_buffer(self) -> np.ndarray:
+        """
+        This thread's (NUM_FRAMES, 112, 112, 3) uint8 frame buffer.
         
+        Sampled frames are resized and colour-converted straight into it,
+        so a call allocates nothing per frame. It is per thread because
+        analyze() can run for several videos at once.
+        """
+        buf = getattr(_thread_state, "frames", None)
+        if buf is None:
+            width, height = self.FRAME_SIZE
+            buf = _thread_state.frames = np.empty((self.NUM_FRAMES, height, width, 3), dtype=np.uint8)
+            _thread_state.resized_bgr = np.empty((height, width, 3), dtype=np.uint8)
+        return buf
+    
+    def _sample_indices(self, total_frames: int) -> np.ndarray:
+        """NUM_FRAMES frame indices spread uniformly over the video."""
         if total_frames < self.NUM_FRAMES:
             logger.warning(f"Video has only {total_frames} frames, need {self.NUM_FRAMES}")
             # Will use available frames with repetition
         
-        # Uniformly sample frame indices
-        indices = np.linspace(0, max(total_frames - 1, 0), self.NUM_FRAMES, dtype=int)
+        # Integer form of linspace(0, total_frames - 1, NUM_FRAMES) truncated
+        # to int: the same indices, without a float64 intermediate
+        # (a zero span, for total_frames <= 1, samples frame 0 throughout)
+        span = max(total_frames - 1, 0)
+        return np.arange(self.NUM_FRAMES, dtype=np.int64) * span // (self.NUM_FRAMES - 1)
+    
+    def _read_frames_pyav(self, video_path: str, frames: np.ndarray):
+        """
+        Decode the sampled frames into `frames` (RGB) with PyAV. Returns how
+        many were filled, or None to fall back to OpenCV.
+        
+        The decoder runs frame-threaded and every frame is decoded in order,
+        but only the sampled ones are converted out of YUV. Frames are still
+        scaled by cv2.resize after conversion rather than by swscale, whose
+        filtering differs from the interpolation the model was trained on.
+        
+        Frames are sampled by index, as in training, when the container
+        header has a frame count; otherwise by timestamp over the stream
+        duration, so OpenCV's frame count guess (an index scan on some MP4s,
+        wrong on VFR streams) is only needed when neither is known.
+        
+        Rotated videos (portrait phone clips with a display matrix) go to
+        OpenCV, which applies the rotation as the model's frames had it.
+        """
+        try:
+            with av.open(video_path) as container:
+                stream = container.streams.video[0]
+                stream.thread_type = "AUTO"
+                if stream.frames > 0:
+                    return self._decode_by_index(container, stream, frames)
+                if stream.duration:
+                    return self._decode_by_time(container, stream, frames)
+                return None  # Neither count nor duration in the container header
+        except _RotatedVideo:
+            logger.debug(f"Rotated video, decoding with OpenCV: {video_path}")
+            return None
+        except Exception as e:
+            logger.warning(f"PyAV decode failed, falling back to OpenCV: {e}")
+            return None
+    
+    @staticmethod
+    def _upright_frames(container, stream):
+        """
+        Decoded frames of `stream`, raising _RotatedVideo at the first one
+        if it has a display rotation. PyAV before 13.1 cannot report the
+        rotation (no VideoFrame.rotation), so those versions always defer
+        to OpenCV rather than risk sideways frames.
+        """
+        frames = container.decode(stream)
+        for frame in frames:
+            rotation = getattr(frame, "rotation", None)
+            if rotation is None or rotation % 360:
+                raise _RotatedVideo()
+            yield frame
+            break
+        yield from frames
+    
+    def _store_frame(self, frame, frames: np.ndarray, t: int):
+        """Convert a decoded PyAV frame and resize it into frames[t]."""
+        # Resizing before or after the BGR->RGB swap is the same
+        cv2.resize(
+            frame.to_ndarray(format='rgb24'), self.FRAME_SIZE,
+            dst=frames[t], interpolation=self.INTERPOLATION
+        )
+    
+    def _decode_by_index(self, container, stream, frames: np.ndarray) -> int:
+        """Fill `frames` with the frames at _sample_indices(stream.frames)."""
+        counts = np.bincount(self._sample_indices(stream.frames))
+        
+        count = 0
+        for i, frame in enumerate(self._upright_frames(container, stream)):
+            if i < len(counts) and counts[i]:
+                self._store_frame(frame, frames, count)
+                frames[count + 1:count + counts[i]] = frames[count]
+                count += counts[i]
+            if i + 1 >= len(counts):
+                break
+        return count
+    
+    def _decode_by_time(self, container, stream, frames: np.ndarray) -> int:
+        """
+        Fill `frames` with the frames nearest NUM_FRAMES timestamps spread
+        uniformly over the stream duration, in one decode pass.
+        
+        The previous frame is kept unconverted, so each target can take
+        whichever of the two frames around it is closer.
+        """
+        start = stream.start_time or 0
+        targets = [
+            start + stream.duration * i // (self.NUM_FRAMES - 1)
+            for i in range(self.NUM_FRAMES)
+        ]
+        
+        count = 0
+        prev = stored = None
+        for frame in self._upright_frames(container, stream):
+            if frame.pts is None:
+                continue
+            while count < self.NUM_FRAMES and frame.pts >= targets[count]:
+                target = targets[count]
+                chosen = frame
+                if prev is not None and target - prev.pts < frame.pts - target:
+                    chosen = prev
+                if chosen is stored:
+                    frames[count] = frames[count - 1]
+                else:
+                    self._store_frame(chosen, frames, count)
+                    stored = chosen
+                count += 1
+            if count == self.NUM_FRAMES:
+                break
+            prev = frame
+        
+        # Targets past the last decoded frame (duration overstated) take it
+        if count < self.NUM_FRAMES and prev is not None and prev is not stored:
+            self._store_frame(prev, frames, count)
+            count += 1
+        return count
+    
+    def _read_frames_cv2(self, video_path: str, frames: np.ndarray):
+        """
+        Decode the sampled frames into `frames` (RGB) with OpenCV. Returns
+        how many were filled, or None if the video cannot be opened.
+        """
+        cap = cv2.VideoCapture(video_path)
+        
+        if not cap.isOpened():
+            logger.error(f"Cannot open video: {video_path}")
+            return None
+        
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        indices = self._sample_indices(total_frames)
+        resized_bgr = _thread_state.resized_bgr
         
-        frames = []
-        for idx in indices:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-            ret, frame = cap.read()
+        pos = 0  # index of the frame the next grab() returns
+        for t, idx in enumerate(indices):
+            if pos == idx + 1:
+                # Index repeated (short video): the frame is already resized
+                frames[t] = frames[t - 1]
+                continue
+            
+            if idx - pos > self.MAX_SCAN_GAP:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                pos = idx
+            
+            # Decode forward to idx; only the kept frame is converted
+            ret = True
+            while ret and pos <= idx:
+                ret = cap.grab()
+                pos += 1
+            if ret:
+                ret, frame = cap.retrieve()
             
             if not ret:
                 # If frame read fails, duplicate last frame
-                if frames:
-                    frames.append(frames[-1].copy())
+                if t > 0:
+                    frames[t] = frames[t - 1]
                 else:
-                    frames.append(np.zeros((self.FRAME_SIZE[1], self.FRAME_SIZE[0], 3), dtype=np.uint8))
+                    frames[t] = 0
                 continue
             
             # Resize to 112x112
-            frame = cv2.resize(frame, self.FRAME_SIZE)
+            cv2.resize(frame, self.FRAME_SIZE, dst=resized_bgr, interpolation=self.INTERPOLATION)
             
             # Convert BGR to RGB
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            frames.append(frame)
+            cv2.cvtColor(resized_bgr, cv2.COLOR_BGR2RGB, dst=frames[t])
         
         cap.release()
-        
-        # Ensure exactly NUM_FRAMES
-        while len(frames) < self.NUM_FRAMES:
-            frames.append(frames[-1].copy() if frames else np.zeros((112, 112, 3), dtype=np.uint8))
-        
-        frames = frames[:self.NUM_FRAMES]
-        
-        # Stack: (T, H, W, C) = (16, 112, 112, 3)
-        video_data = np.array(frames, dtype=np.float32)
-        
-        # Normalize to [0, 1]
-        video_data = video_data / 255.0
-        
-        # Transpose: (T, H, W, C) → (C, T, H, W) = (3, 16, 112, 112)
-        video_data = np.transpose(video_data, (3, 0, 1, 2))
-        
-        # Add batch dimension: (1, 3, 16, 112, 112)
-        video_data = np.expand_dims(video_data, axis=0)
-        
-        logger.debug(f"Preprocessed video shape: {video_data.shape}")
-        
-        return video_data
-    
-    def _stable_softmax(self, logits: np.ndarray) -> np.ndarray:
-        """
-        Numerically stable softmax (from training test code).
-        """
-        exp_logits = np.exp(logits - np.max(logits))
-        return exp_logits / exp_logits.sum()
+        return len(indices)
     
     def analyze(self, video_path: str) -> dict:
         """
@@ -191,41 +488,52 @@ class TemporalDetector:
             - prediction: probabilities
         """
         if not self.is_loaded():
-            logger.error("Temporal detector not loaded")
+            return self._not_loaded_result()
+        
+        try:
+            logger.info(f"Preprocessing video for temporal analysis: {video_path}")
+            input_tensor = self._extract_frames(video_path)
+        except Exception as e:
+            return self._error_result(e)
+        return self._score_clip(input_tensor)
+    
+    def _not_loaded_result(self) -> dict:
+        logger.error("Temporal detector not loaded")
+        return {
+            "error": "Model not loaded",
+            "risk_score": 50.0,
+            "classification": "UNKNOWN",
+            "confidence": "LOW",
+            "prediction": {"fake_probability": 0.5, "real_probability": 0.5}
+        }
+    
+    def _error_result(self, e: Exception) -> dict:
+        logger.error(f"Temporal analysis failed: {e}", exc_info=True)
+        return {
+            "error": str(e),
+            "risk_score": 50.0,
+            "classification": "ERROR",
+            "confidence": "LOW"
+        }
+    
+    def _score_clip(self, input_tensor) -> dict:
+        """Run the 3D CNN on one preprocessed clip and build the report."""
+        if input_tensor is None:
             return {
-                "error": "Model not loaded",
+                "error": "Failed to extract frames",
                 "risk_score": 50.0,
-                "classification": "UNKNOWN",
-                "confidence": "LOW",
-                "prediction": {"fake_probability": 0.5, "real_probability": 0.5}
+                "classification": "UNKNOWN"
             }
         
         try:
-            # Preprocess video
-            logger.info(f"Preprocessing video for temporal analysis: {video_path}")
-            input_tensor = self._extract_frames(video_path)
-            
-            if input_tensor is None:
-                return {
-                    "error": "Failed to extract frames",
-                    "risk_score": 50.0,
-                    "classification": "UNKNOWN"
-                }
-            
             # Run inference
             logger.info("Running temporal 3D CNN inference...")
-            outputs = self.session.run(
-                [self.output_name],
-                {self.input_name: input_tensor}
-            )
-            
-            # Get logits and apply softmax
-            logits = outputs[0][0]  # Shape: (2,)
-            probs = self._stable_softmax(logits)
-            
-            # Extract probabilities
-            prob_real = float(probs[0])  # Class 0 = REAL
-            prob_fake = float(probs[1])  # Class 1 = FAKE
+            if self._batcher is not None:
+                logits = self._batcher(input_tensor)  # Shape: (2,)
+            else:
+                logits = self._run_bound(input_tensor)  # Shape: (2,)
+            # Class 0 = REAL, class 1 = FAKE
+            prob_real, prob_fake = _two_class_probs(logits)
             
             # Calculate risk score
             risk_score = prob_fake * 100.0
@@ -261,13 +569,7 @@ class TemporalDetector:
             }
             
         except Exception as e:
-            logger.error(f"Temporal analysis failed: {e}", exc_info=True)
-            return {
-                "error": str(e),
-                "risk_score": 50.0,
-                "classification": "ERROR",
-                "confidence": "LOW"
-            }
+            return self._error_result(e)
 
 
 # Singleton instance
@@ -0,0 +1,70 @@
+"""
+Export the DeepFace Keras models used by the backend to ONNX.
+
+Run once at deploy time from the backend directory:
+
+    pip install tf2onnx
+    python scripts/export_deepface_onnx.py [Age VGG-Face Facenet ArcFace]
+
+The .onnx files are written to settings.MODELS_DIR, where AgeEstimator and
+FaceRecognitionService pick them up on startup instead of running Keras.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tensorflow as tf
+import tf2onnx
+from deepface import DeepFace
+
+from app.config import settings
+from app.services.deepface_onnx import onnx_filename
+
+DEFAULT_MODELS = ["Age", "VGG-Face", "Facenet", "ArcFace"]
+OPSET = 17
+
+
+def build_keras_model(model_name: str):
+    """Return the underlying Keras model DeepFace builds for `model_name`."""
+    if model_name == "Age":
+        try:
+            client = DeepFace.build_model("Age", task="facial_attribute")
+        except TypeError:
+            # Older deepface releases take no task argument
+            client = DeepFace.build_model("Age")
+    else:
+        try:
+            client = DeepFace.build_model(model_name, task="facial_recognition")
+        except TypeError:
+            client = DeepFace.build_model(model_name)
+    # Newer deepface wraps the Keras model in a client object
+    return getattr(client, "model", client)
+
+
+def export(model_name: str) -> str:
+    model = build_keras_model(model_name)
+    output_path = os.path.join(settings.MODELS_DIR, onnx_filename(model_name))
+
+    # Dynamic batch: match_faces_batch embeds a whole gallery in one run
+    input_shape = (None, *model.input_shape[1:])
+    signature = (tf.TensorSpec(input_shape, tf.float32, name="input"),)
+
+    tf2onnx.convert.from_keras(
+        model,
+        input_signature=signature,
+        opset=OPSET,
+        output_path=output_path
+    )
+    return output_path
+
+
+def main(model_names):
+    os.makedirs(settings.MODELS_DIR, exist_ok=True)
+    for name in model_names:
+        print(f"Exporting {name}...")
+        print(f"  -> {export(name)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_MODELS)
@@ -0,0 +1,54 @@
+"""
+Export the ViT visual detector to ONNX.
+
+Run once at deploy time from the backend directory:
+
+    python scripts/export_vit_onnx.py
+
+The graph is written to settings.MODELS_DIR as VisualDetector.ONNX_FILE,
+where VisualDetector picks it up on startup instead of running PyTorch.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from app.config import settings
+from app.services.visual_detector import LogitsOnly, VisualDetector, visual_detector
+
+OPSET = 17
+
+
+def export() -> str:
+    pt_path = os.path.join(settings.MODELS_DIR, VisualDetector.MODEL_FILE)
+    output_path = os.path.join(settings.MODELS_DIR, VisualDetector.ONNX_FILE)
+    model = LogitsOnly(visual_detector.load_torch_model(pt_path)).eval()
+
+    dummy_input = torch.randn(1, 3, 224, 224)
+
+    torch.onnx.export(
+        model,
+        dummy_input,
+        output_path,
+        export_params=True,
+        opset_version=OPSET,
+        do_constant_folding=True,
+        input_names=['pixel_values'],
+        output_names=['logits'],
+        dynamic_axes={
+            'pixel_values': {0: 'batch_size'},
+            'logits': {0: 'batch_size'}
+        }
+    )
+    return output_path
+
+
+def main():
+    path = export()
+    print(f"ViT -> {path} ({os.path.getsize(path) / (1024 * 1024):.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Fold the softmax over the forensic classifier's logits into its ONNX graph.
+
+Run once from the backend directory:
+
+    pip install onnx
+    python scripts/fold_forensic_softmax.py
+
+Writes forensic_classifier_sm.onnx next to the original in MODELS_DIR.
+ForensicAnalyzer loads it in preference to the plain classifier and then
+uses its output as probabilities directly. Re-run scripts/quantize_models.py
+afterwards to get the INT8 variant of the new model.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import onnx
+from onnx import helper
+
+from app.config import settings
+from app.services.forensic_analyzer import MODEL_NAME, SOFTMAX_MODEL_NAME
+
+
+def main():
+    src = os.path.join(settings.MODELS_DIR, MODEL_NAME)
+    dst = os.path.join(settings.MODELS_DIR, SOFTMAX_MODEL_NAME)
+
+    model = onnx.load(src)
+    graph = model.graph
+    logits = graph.output[0]
+
+    dims = logits.type.tensor_type.shape.dim
+    if not dims or dims[-1].dim_value != 2:
+        # Single-probability outputs are already used as-is by analyze()
+        sys.exit(f"{MODEL_NAME} does not output two-class logits; nothing to fold")
+
+    # Rename the existing output to an internal tensor and expose the
+    # softmax under the original output name, so callers are unchanged
+    logits_name = logits.name + "_logits"
+    for node in graph.node:
+        node.output[:] = [logits_name if out == logits.name else out for out in node.output]
+
+    graph.node.append(helper.make_node("Softmax", [logits_name], [logits.name], axis=-1))
+
+    onnx.checker.check_model(model)
+    onnx.save(model, dst)
+    print(f"{src} -> {dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Inline the temporal 3D CNN's external weight file into its ONNX graph.
+
+Run once from the backend directory:
+
+    pip install onnx
+    python scripts/inline_temporal_onnx.py
+
+Writes TemporalDetector.SINGLE_FILE_MODEL next to the original in
+MODELS_DIR. The model is far below protobuf's 2 GB limit, so the split into
+graph + .onnx.data is unnecessary; TemporalDetector loads the single file
+in preference and no longer needs the data file. Re-run
+scripts/quantize_models.py afterwards to get the INT8 variant of it.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import onnx
+
+from app.config import settings
+from app.services.temporal_detector import TemporalDetector
+
+
+def main():
+    src = os.path.join(settings.MODELS_DIR, TemporalDetector.MODEL_FILE)
+    dst = os.path.join(settings.MODELS_DIR, TemporalDetector.SINGLE_FILE_MODEL)
+
+    # External data paths are resolved relative to the model's directory
+    model = onnx.load(src, load_external_data=True)
+    onnx.checker.check_model(model)
+    onnx.save_model(model, dst, save_as_external_data=False)
+    print(f"{src} -> {dst} ({os.path.getsize(dst) / (1024 * 1024):.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Quantize the backend's ONNX models to INT8.
+
+Run once after the models are in place (and after
+scripts/export_deepface_onnx.py for the DeepFace models):
+
+    python scripts/quantize_models.py [--calibration-dir FACES_DIR]
+                                      [--video-calibration-dir VIDEOS_DIR]
+                                      [--image-calibration-dir IMAGES_DIR]
+
+Each model is written next to the original as `<name>_int8.onnx`, which the
+services load in preference to the float model once USE_INT8_MODELS is
+turned on (it is off by default; check the quantized accuracy first).
+
+The forensic classifier and the age model use dynamic quantization. The
+face recognition models use static quantization calibrated on real face
+crops, which keeps the embedding geometry that cosine matching relies on;
+they are skipped when no --calibration-dir is given. The temporal 3D CNN is
+statically quantized too, calibrated on 16-frame clips preprocessed exactly
+as TemporalDetector does, and skipped without --video-calibration-dir. The
+exported ViT (scripts/export_vit_onnx.py) has only its MatMul/Gemm/Conv ops
+quantized, calibrated on images from --image-calibration-dir; LayerNorm and
+Softmax stay in float.
+"""
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import onnxruntime as ort
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+
+from app.config import settings
+from app.services.deepface_onnx import input_size, onnx_filename, preprocess_face
+from app.services.forensic_analyzer import MODEL_NAME, SOFTMAX_MODEL_NAME
+from app.services.temporal_detector import TemporalDetector, temporal_detector
+from app.services.visual_detector import VisualDetector, visual_detector
+
+DYNAMIC_MODELS = [MODEL_NAME, SOFTMAX_MODEL_NAME, onnx_filename("Age")]
+STATIC_MODELS = [onnx_filename(name) for name in ("VGG-Face", "Facenet", "ArcFace")]
+CALIBRATION_LIMIT = 200
+VIDEO_CALIBRATION_LIMIT = 50
+VIDEO_EXTENSIONS = ("*.mp4", "*.avi", "*.mov", "*.mkv", "*.webm")
+IMAGE_CALIBRATION_LIMIT = 100
+VIT_QUANTIZED_OPS = ["MatMul", "Gemm", "Conv"]
+
+
+class FaceCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed face crops from a directory of images."""
+
+    def __init__(self, model_path: str, image_dir: str):
+        session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = session.get_inputs()[0].name
+        self.size = input_size(session)
+        paths = sorted(
+            glob.glob(os.path.join(image_dir, "*.jpg")) +
+            glob.glob(os.path.join(image_dir, "*.png"))
+        )
+        self.paths = iter(paths[:CALIBRATION_LIMIT])
+
+    def get_next(self):
+        for path in self.paths:
+            img_bgr = cv2.imread(path)
+            if img_bgr is not None:
+                return {self.input_name: preprocess_face(img_bgr, self.size)}
+        return None
+
+
+class ClipCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed 16-frame clips from a directory of videos."""
+
+    def __init__(self, model_path: str, video_dir: str):
+        session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = session.get_inputs()[0].name
+        paths = sorted(
+            path for pattern in VIDEO_EXTENSIONS
+            for path in glob.glob(os.path.join(video_dir, pattern))
+        )
+        self.paths = iter(paths[:VIDEO_CALIBRATION_LIMIT])
+
+    def get_next(self):
+        for path in self.paths:
+            clip = temporal_detector._extract_frames(path)
+            if clip is not None:
+                return {self.input_name: clip}
+        return None
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """Feeds images preprocessed as VisualDetector does from a directory."""
+
+    def __init__(self, model_path: str, image_dir: str):
+        session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = session.get_inputs()[0].name
+        paths = sorted(
+            glob.glob(os.path.join(image_dir, "*.jpg")) +
+            glob.glob(os.path.join(image_dir, "*.png"))
+        )
+        self.paths = iter(paths[:IMAGE_CALIBRATION_LIMIT])
+
+    def get_next(self):
+        for path in self.paths:
+            img_bgr = cv2.imread(path)
+            if img_bgr is not None:
+                img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+                return {self.input_name: visual_detector._preprocess(img_rgb)}
+        return None
+
+
+def quantized_path(path: str) -> str:
+    root, ext = os.path.splitext(path)
+    return root + "_int8" + ext
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calibration-dir", help="Face images used to calibrate the recognition models")
+    parser.add_argument("--video-calibration-dir", help="Videos used to calibrate the temporal model")
+    parser.add_argument("--image-calibration-dir", help="Images used to calibrate the ViT visual detector")
+    args = parser.parse_args()
+
+    for name in DYNAMIC_MODELS:
+        path = os.path.join(settings.MODELS_DIR, name)
+        if not os.path.exists(path):
+            print(f"Skipping {name}: not found")
+            continue
+        quantize_dynamic(path, quantized_path(path), weight_type=QuantType.QInt8)
+        print(f"{name} -> {quantized_path(path)}")
+
+    for name in STATIC_MODELS:
+        path = os.path.join(settings.MODELS_DIR, name)
+        if not os.path.exists(path):
+            print(f"Skipping {name}: not found")
+            continue
+        if not args.calibration_dir:
+            print(f"Skipping {name}: static quantization needs --calibration-dir")
+            continue
+        quantize_static(
+            path,
+            quantized_path(path),
+            FaceCalibrationReader(path, args.calibration_dir),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+        print(f"{name} -> {quantized_path(path)}")
+
+    name = TemporalDetector.SINGLE_FILE_MODEL if temporal_detector.single_file else TemporalDetector.MODEL_FILE
+    path = os.path.join(settings.MODELS_DIR, name)
+    if not os.path.exists(path):
+        print(f"Skipping {name}: not found")
+    elif not args.video_calibration_dir:
+        print(f"Skipping {name}: static quantization needs --video-calibration-dir")
+    else:
+        quantize_static(
+            path,
+            quantized_path(path),
+            ClipCalibrationReader(path, args.video_calibration_dir),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            reduce_range=False
+        )
+        print(f"{name} -> {quantized_path(path)}")
+
+    name = VisualDetector.ONNX_FILE
+    path = os.path.join(settings.MODELS_DIR, name)
+    if not os.path.exists(path):
+        print(f"Skipping {name}: not found")
+    elif not args.image_calibration_dir:
+        print(f"Skipping {name}: static quantization needs --image-calibration-dir")
+    else:
+        quantize_static(
+            path,
+            quantized_path(path),
+            ImageCalibrationReader(path, args.image_calibration_dir),
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=VIT_QUANTIZED_OPS,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+        print(f"{name} -> {quantized_path(path)}")
+
+
+if __name__ == "__main__":
+    main()
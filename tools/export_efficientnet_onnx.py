@@ -2,13 +2,49 @@
 Export EfficientNet-B0 Deepfake Detector to ONNX
 Based on TRahulsingh/DeepfakeDetector architecture
 Run this once to convert .pt to .onnx
+
+Optional post-passes (install the packages to use them):
+    onnxsim               - graph simplification (--simplify)
+    onnxconverter-common  - FP16 weight copy (--fp16)
 """
 import torch
 from torchvision.models import efficientnet_b0, EfficientNet_B0_Weights
 import argparse
 import os
 
-def export_to_onnx(pt_path: str, onnx_path: str):
+def simplify_onnx(onnx_path: str):
+    """Simplify the exported graph in place with onnxsim."""
+    import onnx
+    from onnxsim import simplify
+    
+    model, ok = simplify(onnx.load(onnx_path))
+    if not ok:
+        print("⚠️  onnxsim could not validate the simplified graph; keeping the original")
+        return
+    onnx.save(model, onnx_path)
+    print(f"✅ Simplified graph saved to: {onnx_path}")
+
+def convert_fp16(onnx_path: str) -> str:
+    """Write an FP16-weight copy next to `onnx_path`; inputs/outputs stay float32."""
+    import onnx
+    from onnxconverter_common import float16
+    
+    root, ext = os.path.splitext(onnx_path)
+    fp16_path = root + "_fp16" + ext
+    model = float16.convert_float_to_float16(onnx.load(onnx_path), keep_io_types=True)
+    onnx.save(model, fp16_path)
+    print(f"✅ FP16 model saved to: {fp16_path}")
+    print(f"   File size: {os.path.getsize(fp16_path) / (1024*1024):.2f} MB")
+    return fp16_path
+
+def export_to_onnx(
+    pt_path: str,
+    onnx_path: str,
+    opset: int = 17,
+    static_batch: bool = False,
+    simplify: bool = False,
+    fp16: bool = False
+):
     """Convert PyTorch model to ONNX format."""
     
     print(f"Loading PyTorch model from: {pt_path}")
@@ -31,18 +67,19 @@ def export_to_onnx(pt_path: str, onnx_path: str):
     # Create dummy input (batch=1, channels=3, height=224, width=224)
     dummy_input = torch.randn(1, 3, 224, 224)
     
-    print(f"Exporting to ONNX: {onnx_path}")
+    print(f"Exporting to ONNX: {onnx_path} (opset {opset})")
     
+    # Eval-mode export with constant folding folds BatchNorm into the convs
     torch.onnx.export(
         model,
         dummy_input,
         onnx_path,
         export_params=True,
-        opset_version=11,
+        opset_version=opset,
         do_constant_folding=True,
         input_names=['input'],
         output_names=['output'],
-        dynamic_axes={
+        dynamic_axes=None if static_batch else {
             'input': {0: 'batch_size'},
             'output': {0: 'batch_size'}
         }
@@ -50,11 +87,27 @@ def export_to_onnx(pt_path: str, onnx_path: str):
     
     print(f"✅ ONNX model saved to: {onnx_path}")
     print(f"   File size: {os.path.getsize(onnx_path) / (1024*1024):.2f} MB")
+    
+    if simplify:
+        simplify_onnx(onnx_path)
+    if fp16:
+        convert_fp16(onnx_path)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Export EfficientNet-B0 to ONNX")
     parser.add_argument("--input", default="Models/best_model-v3.pt", help="Input .pt file")
     parser.add_argument("--output", default="Models/efficientnet_deepfake.onnx", help="Output .onnx file")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    parser.add_argument("--static-batch", action="store_true", help="Fix the batch size to 1")
+    parser.add_argument("--simplify", action="store_true", help="Simplify the graph with onnxsim")
+    parser.add_argument("--fp16", action="store_true", help="Also write an FP16-weight *_fp16.onnx copy")
     args = parser.parse_args()
     
-    export_to_onnx(args.input, args.output)
+    export_to_onnx(
+        args.input,
+        args.output,
+        opset=args.opset,
+        static_batch=args.static_batch,
+        simplify=args.simplify,
+        fp16=args.fp16
+    )